@@ -2,19 +2,22 @@
 """
 
 import socket
-import json
-import csv
+import time
+import queue
+import argparse
 import numpy as np
-import metadataHandler, measurementHandler
+import measurementHandler, packageDecoder, streamWriter, acquisitionPipeline, streamCapture, processingStage, streamingStats, fanoutServer, sharedRingBuffer, csvExporter, instrumentation
+from packageFramer import packageFramer
+from multiChannelHandler import multiChannelHandler
 
-def connectClient(ipAddress):
+def connectClient(ipAddress, port=50000):
     """ Function to create client socket and connect it to Odisi server.  
     """
     # Create a TCP/IP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     # Connect the socket to the port where the server is listening
-    server_address = (ipAddress, 50000)
+    server_address = (ipAddress, port)
     print('Connecting to %s port %s' % server_address)
     sock.connect(server_address)
 
@@ -49,6 +52,10 @@ def parseReceivedData(receivedData, storedData=''):
         except IndexError:
             return None
 
+    recorder = instrumentation.recorder
+    if recorder is not None:
+        startTime = time.perf_counter_ns()
+
     # First, handle any stored data from previous iteration
     workingData = storedData + receivedData
     packages = []
@@ -70,135 +77,305 @@ def parseReceivedData(receivedData, storedData=''):
 
     # Store remaining data if it starts with a new package
     newStoredData = workingData if workingData.startswith(b'{') else b''
+
+    if recorder is not None:
+        recorder.observe('parse', time.perf_counter_ns() - startTime)
+        recorder.count('parsed packages', len(packages))
     
     if packages:
         return packages, newStoredData, checksums
     return None, workingData, None
 
-def getMeasurementCycle(connectedSocket, metadataObj, measurementObj):
+def processPackage(receivedDataJSON, checksum, metadataObj, measurementObj, measurementStarted):
+    """ Function that handles a decoded package (metadata or measurement) of a measurement cycle.
+    Inputs:
+        receivedDataJSON: dict
+            Decoded package.
+        checksum: str
+            Checksum of the package.
+        measurementStarted: bool
+            True if a measurement package of the current cycle has already been received.
+    Outputs:
+        measurementStarted: bool
+            Updated value of measurementStarted.
+        cycleComplete: bool
+            True if the package ends the measurement cycle (measurementObj.emptyBuffer() has been called).
+    """
+    recorder = instrumentation.recorder
+    if receivedDataJSON['message type'] == 'metadata':                        
+        startTime = time.perf_counter_ns() if recorder is not None else 0
+        metadataObj.processMetadata(checksum, receivedDataJSON, measurementStarted)
+        if recorder is not None:
+            recorder.observe('metadata', time.perf_counter_ns() - startTime)
+            recorder.count('metadata packages')
+        # Check if the measurement has stopped:
+        # (It may be slow because the program has to wait for the Odisi to send a metadata package
+        # containing the 'stopped' status after the measuring is done, which may take up to 5 seconds)
+        if metadataObj.checkStatus() == 'stop' and measurementStarted:
+            measurementObj.emptyBuffer()
+            return measurementStarted, True
+    elif receivedDataJSON['message type'] == 'measurement':
+        # Sometimes the Odisi sends empty packages for some reason
+        if len(receivedDataJSON['data']) != 0:                                                 
+            if not measurementStarted and metadataObj.checkStatus() == 'stop':
+                measurementStarted = True
+                print('Acquiring measurement...')
+            try:                        
+                startTime = time.perf_counter_ns() if recorder is not None else 0
+                measurementObj.processMeasurement(receivedDataJSON, metadataObj)                        
+                if recorder is not None:
+                    recorder.observe('measurement', time.perf_counter_ns() - startTime)
+                    recorder.count('measurement packages')
+            except processingStage.regionOfInterestError:
+                # Wrong configuration: it would fail with every package
+                raise
+            except Exception as error: # Just to avoid stopping the program because of a malformed package (lost packages are handled by the gap tracker)
+                print('Package discarded! %s' % error)
+                if recorder is not None:
+                    recorder.count('discarded packages')
+        else:
+            pass
+    elif receivedDataJSON['message type'] == 'tare': # I've never seen a tare package lol
+        pass
+    return measurementStarted, False
+
+def getMeasurementCycle(connectedSocket, metadataObj, measurementObj, framer=None):
     """ Function to retrieve and return the measurement data of a single measurement cycle from Odisi.
 
     This function keeps receiving TCP messages (metadata or measurement) until a complete measurement cycle is received.    
+    It returns (measurementData, timeData, positionData, posNames, gapSummary), see measurementHandler.getCycle.
+    The framer keeps the incomplete packages between calls, so the same framer should be used for the whole connection.
     """
-    storedData = b''
+    if framer is None:
+        framer = packageFramer()
     measurementStarted = False
+    # Instrumentation (see instrumentation.py), only if it is enabled
+    recorder = instrumentation.recorder
       
     while True:        
-        receivedData = connectedSocket.recv(4096)
-        #print(receivedData)
-
-        result = parseReceivedData(receivedData, storedData)
-        packages, storedData, checksums = result if result[0] else ([], result[1], [])
-
-        if packages:
-            for package, checksum in zip(packages, checksums):                
-                receivedDataJSON = json.loads(package)
-
-                if receivedDataJSON['message type'] == 'metadata':                        
-                    metadataObj.processMetadata(checksum, receivedDataJSON, measurementStarted)
-                    # Check if the measurement has stopped:
-                    # (It may be slow because the program has to wait for the Odisi to send a metadata package
-                    # containing the 'stopped' status after the measuring is done, which may take up to 5 seconds)
-                    if metadataObj.checkStatus() == 'stop' and measurementStarted:
-                        measurementObj.emptyBuffer()
-                        return measurementObj.measurement[1:,:], measurementObj.time, measurementObj.position, measurementObj.posNames
-                elif receivedDataJSON['message type'] == 'measurement':
-                    # Sometimes the Odisi sends empty packages for some reason
-                    if len(receivedDataJSON['data']) != 0:                                                 
-                        if not measurementStarted and metadataObj.checkStatus() == 'stop':
-                            measurementStarted = True
-                            print('Acquiring measurement...')
-                        try:                        
-                            measurementObj.processMeasurement(receivedDataJSON, metadataObj)                        
-                        except: # Just to avoid stopping the program when there is a package continuity error (very rare)
-                            pass
-                    else:
-                        pass
-                elif receivedDataJSON['message type'] == 'tare': # I've never seen a tare package lol
-                    pass
+        startTime = time.perf_counter_ns() if recorder is not None else 0
+        nBytes = framer.recvInto(connectedSocket)
+        if recorder is not None:
+            stageTime = time.perf_counter_ns()
+            recorder.observe('recv', stageTime - startTime)
+            recorder.observeSize('recv size', nBytes)
+            recorder.count('received bytes', nBytes)
+            recorder.setGauge('framer pending bytes', framer.pendingBytes())
+        if nBytes == 0:
+            raise ConnectionError('Connection closed by the Odisi server')
+
+        for payload, checksum in framer.packages():
+            if recorder is not None:
+                decodeTime = time.perf_counter_ns()
+                recorder.observe('framing', decodeTime - stageTime)
+            receivedDataJSON = packageDecoder.decodePackage(payload)
+            if recorder is not None:
+                recorder.observe('decode', time.perf_counter_ns() - decodeTime)
+                recorder.count('packages')
+            measurementStarted, cycleComplete = processPackage(receivedDataJSON, checksum, metadataObj, measurementObj, measurementStarted)
+            if cycleComplete:
+                if recorder is not None:
+                    recorder.count('cycles')
+                return measurementObj.getCycle()
+            if recorder is not None:
+                stageTime = time.perf_counter_ns()
 
-def saveMeasurementsCSV(measurementData, timeData, positionData, positionNames, filename):
+def saveMeasurementsCSV(measurementData, timeData, positionData, positionNames, filename, withDate=False,
+                        decimals=None, compression=None, workers=1, info=None):
     """Save measurement data, time data and position data to a CSV file.
 
-    Maybe include metadata information such as measurement rate, gage pitch, sensor type, etc.?
+    The timestamps (microseconds since the epoch) are formatted here, with or without the date.
+    The rows are formatted in large blocks (see csvExporter): with decimals, as fixed-point (much faster),
+    with workers > 1, in parallel processes, and with compression ('gzip' or 'zstd'), compressed.
+    With info (see measurementHandler.getInfo), the metadata and the sequence gap summary are saved in a JSON file
+    next to the CSV file.
     """
-    # Maybe check for filename validity?
-    if not filename.endswith('.csv'):
-        filename += '.csv'
-        
-    # Create header with position values
-    if len(positionNames) != 0:
-        header = ['Gage/Segment Name']
-        header.extend([name for name in positionNames])
-        tempHeader = ['X-axis']
-        tempHeader.extend([f'{pos:.2f}' for pos in positionData])
-        header = np.vstack((header,tempHeader)).tolist()
-    else:
-        header = ['X-axis']
-        header.extend([f'{pos:.2f}' for pos in positionData])
-
-        
-    with open(filename, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        # Write header
-        if len(positionNames) != 0:
-            for i in range(len(header)):
-                writer.writerow(header[i])
-        else:      
-            writer.writerow(header)
-    
-        # Write data rows
-        for i in range(len(timeData)):
-            row = [timeData[i]]
-            row.extend(measurementData[i])
-            writer.writerow(row)
+    stats = csvExporter.exportCSV(measurementData, timeData, positionData, positionNames, filename, withDate,
+                                  decimals, compression, workers, info=info)
+    return stats['filename']
 
-    return filename            
+def printAlarm(channel, stats, timestamp, gageIndex, values):
+    """ Function that prints the gages that went out of the alarm limits.
+    """
+    timeString = measurementHandler.formatTimestamps(np.array([timestamp]))[0]
+    gages = ', '.join('%.2f mm (%.3f)' % (stats.position[i], value) for i, value in zip(gageIndex[:5], values[:5]))
+    more = ' and %i more' % (len(gageIndex) - 5) if len(gageIndex) > 5 else ''
+    print(f"Alarm! {timeString} channel {channel}: {gages}{more}")
 
-def receiveAndProcessData(connectedSocket):
+def receiveAndProcessData(connectedSocket, streamFormat=None, fillGaps=False, processingOptions=None, alarmLimits=None,
+                          publishAddress=None, sharedRingName=None,
+                          exportOptions=None):
     """ Function to receive data from Odisi.
 
     It obtains the measurement data, time data, and position data from one measurement cycle. 
     Then, the data is processed (for now only stored into a CSV or JSON file).
     Afterwards, a new measurement cycle is started.
     This keeps running until the user stops the program with a Keyboard Interruption (ctrl + c).
+    With streamFormat ('npy' or 'hdf5'), the data is written to disk while measuring (see streamWriter)
+    and saving only renames the files.
+    With fillGaps, NaN rows are inserted for the lost packages (see measurementHandler).
+    With processingOptions (processingStage arguments), only the region of interest is stored, decimated.
+    With alarmLimits (low, high), a message is printed while measuring when a gage goes out of the limits
+    (see streamingStats).
+    With publishAddress (Unix socket path or (host, port)), the rows are published live to local subscribers
+    (see fanoutServer).
+    With sharedRingName, the last rows of every channel are kept in shared memory, to be read by other processes
+    while measuring (see sharedRingBuffer).
+    exportOptions (csvExporter.exportCSV arguments: decimals, compression, workers) configure the CSV files.
+    The data is received and processed in background threads (see acquisitionPipeline), so the next
+    cycle is already being acquired while the user is asked for a filename.
     """
-    metadataObj = metadataHandler.metadataHandler()
+    def newChannelHandler(channel):
+        writer = None
+        if streamFormat is not None:
+            writer = streamWriter.openStreamWriter(time.strftime('odisi_stream_%Y%m%d_%H%M%S') + '_ch%s' % channel, streamFormat)
+        processing = None
+        if processingOptions:
+            processing = processingStage.processingStage(**processingOptions)
+        listeners = []
+        if alarmLimits is not None:
+            stats = streamingStats.streamingStats()
+            stats.addAlarm(lambda name, timestamp, gageIndex, values: printAlarm(channel, stats, timestamp, gageIndex, values),
+                           low=alarmLimits[0], high=alarmLimits[1])
+            listeners.append(stats)
+        if server is not None:
+            listeners.append(server.publisher(channel if channel is not None else 1))
+        sharedRing = None
+        if sharedRingName is not None:
+            # The same ring is used by every cycle of the channel
+            if channel not in sharedRings:
+                ringName = sharedRingName if channel in (None, 1) else sharedRingName + '_ch%s' % channel
+                sharedRings[channel] = sharedRingBuffer.sharedRingBuffer(ringName)
+            sharedRing = sharedRings[channel]
+        return measurementHandler.measurementHandler(writer=writer, fillGaps=fillGaps, processing=processing, listeners=listeners,
+                                                     sharedRing=sharedRing)
+
+    sharedRings = {}
+    server = None
+    if publishAddress is not None:
+        server = fanoutServer.fanoutServer(publishAddress)
+        print(f"Publishing the measurements on {server.address}")
+
+    pipeline = acquisitionPipeline.acquisitionPipeline(connectedSocket, lambda: multiChannelHandler(newChannelHandler))
+    pipeline.start()
     
     try:        
         while True:
-            measurementObj = measurementHandler.measurementHandler()
-            
-            # Get measurement data, time data, and position data from one measurement cycle
-            measurementData, timeData, positionData, posNames = getMeasurementCycle(connectedSocket, metadataObj, measurementObj)            
+            # Get measurement data, time data, and position data from one measurement cycle (of every channel)
+            # (with a timeout, so Ctrl+C is not blocked while waiting)
+            try:
+                measurementObj, cycle = pipeline.getCycle(timeout=0.5)
+            except queue.Empty:
+                continue
 
             # Process the data
             print('Processing data, please wait before measuring again!')
-            print(f"Received {len(measurementData)} measurements")
+            for channel, channelObj in measurementObj.channels.items():
+                print(f"Received {channelObj.getSampleCount()} measurements (channel {channel})")
+                if channelObj.gaps.lost > 0:
+                    print(f"Lost {channelObj.gaps.lost} packages in {len(channelObj.gaps.gaps)} gaps ({100 * channelObj.gaps.getLossRate():.3f} %)")
             
             # Get filename from user
             userinput = input("Enter filename to save the data or type 'DEL' to delete the current data: ")
-            if userinput != 'DEL' and userinput != 'del':
-                filenameOut = saveMeasurementsCSV(measurementData, timeData, positionData, posNames,userinput)
-                print(f"Data saved to {filenameOut}")
-            else:
-                print("Data deleted!")   # Actually does not delete anything, just skips the saving.
+            for channel, channelObj in measurementObj.channels.items():
+                writer = channelObj.writer
+                if userinput != 'DEL' and userinput != 'del':
+                    # One file per channel (the channel is only added to the filename if there are several)
+                    filename = userinput if len(measurementObj.channels) == 1 else userinput + '_ch%s' % channel
+                    if writer is None:
+                        exportStats = csvExporter.exportCSV(channelObj.measurement, channelObj.time, channelObj.position, channelObj.posNames,
+                                                      filename, info=channelObj.getInfo(), **(exportOptions or {}))
+                        filenameOut = (f"{exportStats['filename']} ({exportStats['text bytes'] / 1e6:.1f} MB in "
+                                       f"{exportStats['seconds']:.2f} s, {exportStats['MB/s']:.1f} MB/s)")
+                    else:
+                        filenameOut = ', '.join(writer.rename(filename))
+                    print(f"Data saved to {filenameOut}")
+                elif writer is not None:
+                    writer.delete()
+            if userinput == 'DEL' or userinput == 'del':
+                print("Data deleted!")   # Actually does not delete anything, just skips the saving (unless streaming).
 
-            metadataObj.resetChecksum() # Force an update on the metadata parameters to avoid problems when changing the config.
+            stats = pipeline.getStats()
+            if stats['receiver overflows'] or stats['cycle overflows']:
+                print(f"Warning: the processing could not keep up with the Odisi ({stats['receiver overflows']} receiver overflows, {stats['cycle overflows']} cycle overflows)")
             print("Wait for metadata update before measuring again!")
-            
-            # measurementObj = None # ?
 
     except KeyboardInterrupt:
         print("Program stopped by user")
         return
+    except ConnectionError:
+        print("Connection closed by the Odisi")
+        return
+    except processingStage.regionOfInterestError as error:
+        print(error)
+        return
+    finally:
+        pipeline.stop()
+        if server is not None:
+            server.close()
+        for sharedRing in sharedRings.values():
+            sharedRing.close()
 
 def main():
+    parser = argparse.ArgumentParser(description='TCP client for the Odisi 6001.')
+    parser.add_argument('--stream', choices=['npy', 'hdf5'], default=None,
+                        help='Write the data to disk while measuring (instead of saving a CSV file at the end).')
     # Read the IP address from the Odisi device (in Settings -> Streaming Properties)
-    socketObj = connectClient('169.254.151.199')
+    parser.add_argument('--fill-gaps', action='store_true',
+                        help='Insert NaN rows for the lost packages, to keep the time base uniform.')
+    parser.add_argument('--capture', default=None, metavar='FILE',
+                        help='Also save the raw received datastream (with timestamps) into FILE, to replay it later with odisiSimulator.serveCapture.')
+    parser.add_argument('--roi', type=float, nargs=2, action='append', default=None, metavar=('START', 'END'),
+                        help='Only store the gages between START and END (mm). Can be repeated.')
+    parser.add_argument('--gages', nargs='+', default=None, metavar='NAME',
+                        help='Only store these gages or segments (by name).')
+    parser.add_argument('--decimate', type=int, default=1, metavar='N',
+                        help='Store one row per N samples (the mean of the N samples, see --envelope).')
+    parser.add_argument('--envelope', action='store_true',
+                        help='With --decimate, store the minimum and maximum of every N samples instead of the mean.')
+    parser.add_argument('--alarm', type=float, nargs=2, default=None, metavar=('LOW', 'HIGH'),
+                        help='Print a message while measuring when a gage goes below LOW or above HIGH.')
+    parser.add_argument('--publish', default=None, metavar='ADDRESS',
+                        help='Publish the measurements live to local subscribers (see fanoutServer.py), on HOST:PORT or on a Unix socket path.')
+    parser.add_argument('--shared-ring', default=None, metavar='NAME',
+                        help='Also copy the last rows into shared memory NAME (NAME_chN for the other channels), so other processes can read them while measuring (see sharedRingBuffer.py). The whole cycle is still saved.')
+    parser.add_argument('--decimals', type=int, default=None, metavar='N',
+                        help='Write the CSV data with N decimals (much faster than the default shortest representation).')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], default=None,
+                        help='Compress the CSV files (zstd requires the zstandard package).')
+    parser.add_argument('--export-workers', type=int, default=1, metavar='N',
+                        help='Format the CSV files in N parallel processes (default: %(default)s).')
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help='Enable the instrumentation and serve the metrics (Prometheus text format) on http://127.0.0.1:PORT/metrics.')
+    parser.add_argument('--ip', default='169.254.151.199', help='IP address of the Odisi (default: %(default)s).')
+    parser.add_argument('--port', type=int, default=50000, help='Port of the Odisi server (default: %(default)s).')
+    args = parser.parse_args()
+    publishAddress = args.publish
+    if publishAddress is not None and ':' in publishAddress:
+        host, port = publishAddress.rsplit(':', 1)
+        publishAddress = (host, int(port))
+    processingOptions = None
+    if args.roi or args.gages or args.decimate > 1:
+        processingOptions = {'positionRanges': args.roi, 'names': args.gages, 'decimation': args.decimate,
+                             'mode': 'minmax' if args.envelope else 'mean'}
+        # Invalid options are reported before connecting (the positions are only checked with the first package)
+        try:
+            processingStage.processingStage(**processingOptions)
+        except Exception as error:
+            parser.error(str(error))
+
+    if args.metrics_port is not None:
+        instrumentation.enable()
+        instrumentation.startMetricsServer(args.metrics_port)
+        print(f"Serving the metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+    socketObj = connectClient(args.ip, args.port)
+    if args.capture is not None:
+        socketObj = streamCapture.captureSocket(socketObj, args.capture)
 
     try:
-        receiveAndProcessData(socketObj)        
+        receiveAndProcessData(socketObj, args.stream, args.fill_gaps, processingOptions, args.alarm, publishAddress,
+                              args.shared_ring, {'decimals': args.decimals, 'compression': args.compress, 'workers': args.export_workers})        
     finally:
         print('Closing socket')
         socketObj.close()
@@ -0,0 +1,188 @@
+""" Producer-consumer acquisition pipeline.
+
+A receiver thread only drains the socket (recv_into large preallocated chunks) into a bounded queue,
+and a worker thread frames, decodes and stores the packages (getMeasurementCycle). Complete measurement
+cycles are put into another bounded queue, so the main thread can save a cycle (or wait for the user)
+while the next one is already being acquired.
+"""
+
+import time
+import queue
+import socket
+import threading
+import metadataHandler, measurementHandler, instrumentation
+from packageFramer import packageFramer
+
+class socketReceiver:
+    """ Socket receiver class
+
+    The received chunks are handed over to the consumer through recv_into(), so the receiver can be
+    used in place of the socket by getMeasurementCycle. The chunk buffers are recycled: when all the
+    chunks are in use (the consumer is late), the receiver waits for one (backpressure) and counts it.
+    """
+    def __init__(self, connectedSocket, chunkSize=262144, chunksNumber=64):
+        self.connectedSocket = connectedSocket
+        self.chunkSize = chunkSize
+        self.freeChunks = queue.Queue()
+        for _ in range(chunksNumber):
+            self.freeChunks.put(bytearray(chunkSize))
+        self.filledChunks = queue.Queue(maxsize=chunksNumber)
+
+        self.currentChunk = None        # Chunk being read by the consumer: (buffer, size)
+        self.currentOffset = 0
+        self.closed = False
+
+        # Statistics
+        self.bytesReceived = 0
+        self.chunksReceived = 0
+        self.overflowCount = 0          # Times the receiver had to wait for a free chunk
+        self.maxQueueDepth = 0
+
+        self.thread = threading.Thread(target=self.run, name='socketReceiver', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        """ Function that runs in the receiver thread: drains the socket into the chunk queue.
+        """
+        while True:
+            try:
+                chunk = self.freeChunks.get_nowait()
+            except queue.Empty:
+                self.overflowCount += 1
+                chunk = self.freeChunks.get()
+
+            recorder = instrumentation.recorder
+            startTime = time.perf_counter_ns() if recorder is not None else 0
+            try:
+                nBytes = self.connectedSocket.recv_into(chunk)
+            except OSError:
+                nBytes = 0
+            if recorder is not None:
+                recorder.observe('socket recv', time.perf_counter_ns() - startTime)
+                recorder.observeSize('socket recv size', nBytes)
+
+            if nBytes == 0:
+                # Connection closed: let the consumer know
+                self.filledChunks.put(None)
+                return
+
+            self.bytesReceived += nBytes
+            self.chunksReceived += 1
+            self.filledChunks.put((chunk, nBytes))
+            self.maxQueueDepth = max(self.maxQueueDepth, self.filledChunks.qsize())
+
+    def recv_into(self, buffer):
+        """ Function that copies the next received bytes into buffer (same behaviour as socket.recv_into).
+        """
+        if self.currentChunk is None:
+            if self.closed:
+                return 0
+            self.currentChunk = self.filledChunks.get()
+            self.currentOffset = 0
+            if self.currentChunk is None:
+                self.closed = True
+                return 0
+
+        chunk, chunkBytes = self.currentChunk
+        nBytes = min(len(buffer), chunkBytes - self.currentOffset)
+        buffer[:nBytes] = memoryview(chunk)[self.currentOffset:self.currentOffset + nBytes]
+        self.currentOffset += nBytes
+        if self.currentOffset == chunkBytes:
+            # The chunk has been consumed, recycle it
+            self.currentChunk = None
+            self.freeChunks.put(chunk)
+        return nBytes
+
+    def stop(self):
+        """ Function that stops the receiver (the socket is shut down to unblock recv).
+        """
+        try:
+            self.connectedSocket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class acquisitionPipeline:
+    """ Acquisition pipeline class
+
+    Inputs:
+        connectedSocket: socket
+            Socket connected to the Odisi.
+        measurementFactory: function
+            Function that returns a new measurementHandler for every cycle (default: measurementHandler()).
+        maxCycles: int
+            Maximum number of complete cycles waiting to be processed.
+    """
+    def __init__(self, connectedSocket, measurementFactory=None, chunkSize=262144, chunksNumber=64, maxCycles=2):
+        self.receiver = socketReceiver(connectedSocket, chunkSize, chunksNumber)
+        self.framer = packageFramer(chunkSize=chunkSize)
+        self.metadataObj = metadataHandler.metadataHandler()
+        self.measurementFactory = measurementFactory if measurementFactory is not None else measurementHandler.measurementHandler
+        self.cycles = queue.Queue(maxsize=maxCycles)
+
+        # Statistics
+        self.cyclesAcquired = 0
+        self.cycleOverflowCount = 0     # Times the worker had to wait because the cycle queue was full
+
+        self.thread = threading.Thread(target=self.run, name='acquisitionWorker', daemon=True)
+
+    def start(self):
+        if instrumentation.recorder is not None:
+            for name, function in (('chunk queue depth', self.receiver.filledChunks.qsize),
+                                   ('cycles waiting', self.cycles.qsize),
+                                   ('receiver overflows', lambda: self.receiver.overflowCount),
+                                   ('cycle overflows', lambda: self.cycleOverflowCount),
+                                   ('max chunk queue depth', lambda: self.receiver.maxQueueDepth)):
+                instrumentation.recorder.addGauge(name, function)
+        self.receiver.start()
+        self.thread.start()
+
+    def run(self):
+        """ Function that runs in the worker thread: frames, decodes and stores the packages of every cycle.
+        """
+        # Imported here to avoid a circular import (OdisiTCPClient uses this module)
+        from OdisiTCPClient import getMeasurementCycle
+
+        while True:
+            measurementObj = self.measurementFactory()
+            try:
+                cycle = getMeasurementCycle(self.receiver, self.metadataObj, measurementObj, self.framer)
+            except Exception as error:
+                self.cycles.put(error)
+                return
+
+            self.metadataObj.resetChecksum() # Force an update on the metadata parameters to avoid problems when changing the config.
+            self.cyclesAcquired += 1
+            try:
+                self.cycles.put_nowait((measurementObj, cycle))
+            except queue.Full:
+                self.cycleOverflowCount += 1
+                self.cycles.put((measurementObj, cycle))
+
+    def getCycle(self, timeout=None):
+        """ Function that returns the next complete cycle as (measurementObj, (measurementData, timeData, positionData, posNames, gapSummary)).
+
+        Raises the exception that stopped the worker (e.g. ConnectionError) and queue.Empty after timeout.
+        """
+        item = self.cycles.get(timeout=timeout)
+        if isinstance(item, Exception):
+            # Keep it for the next calls
+            self.cycles.put(item)
+            raise item
+        return item
+
+    def getStats(self):
+        """ Function that returns the pipeline statistics as a dictionary.
+        """
+        return {'bytes received': self.receiver.bytesReceived,
+                'chunks received': self.receiver.chunksReceived,
+                'receiver overflows': self.receiver.overflowCount,
+                'chunk queue depth': self.receiver.filledChunks.qsize(),
+                'max chunk queue depth': self.receiver.maxQueueDepth,
+                'cycles acquired': self.cyclesAcquired,
+                'cycles waiting': self.cycles.qsize(),
+                'cycle overflows': self.cycleOverflowCount}
+
+    def stop(self):
+        self.receiver.stop()
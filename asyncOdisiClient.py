@@ -0,0 +1,144 @@
+""" asyncio client for the Odisi 6001.
+
+Example:
+    client = asyncOdisiClient('169.254.151.199')
+    async for measurementObj, cycle in client.cycles():
+        measurementData, timeData, positionData, posNames, gapSummary = cycle
+        ...
+
+It uses the same framing (packageFramer), decoding (packageDecoder) and package handling
+(OdisiTCPClient.processPackage, metadataHandler, measurementHandler) as the synchronous client,
+so it can run inside other asyncio services without a thread per device.
+"""
+
+import asyncio
+import metadataHandler, measurementHandler, packageDecoder
+from packageFramer import packageFramer
+from OdisiTCPClient import processPackage
+
+class asyncOdisiClient:
+    """ asyncio Odisi client class
+
+    Inputs:
+        host: str
+            IP address of the Odisi (Settings -> Streaming Properties).
+        port: int
+            Port of the Odisi server.
+        reconnect: bool
+            If True, the client reconnects (with exponential backoff) when the connection is lost.
+        measurementFactory: function
+            Function that returns a new measurementHandler for every cycle (default: measurementHandler()).
+    """
+    def __init__(self, host, port=50000, reconnect=True, initialBackoff=0.5, maxBackoff=30.0, readSize=262144, measurementFactory=None):
+        self.host = host
+        self.port = port
+        self.reconnect = reconnect
+        self.initialBackoff = initialBackoff
+        self.maxBackoff = maxBackoff
+        self.readSize = readSize
+        self.measurementFactory = measurementFactory if measurementFactory is not None else measurementHandler.measurementHandler
+
+        self.reader = None
+        self.writer = None
+        self.framer = packageFramer(chunkSize=readSize)
+        self.metadataObj = metadataHandler.metadataHandler()
+        self.connectionCount = 0    # Number of successful connections (it changes when the client reconnects)
+        self.backoff = initialBackoff   # Delay before the next reconnection (reset when a package is received)
+        self.closed = False
+
+        # Statistics
+        self.bytesReceived = 0
+        self.packagesReceived = 0
+
+    async def connect(self):
+        """ Function that connects to the Odisi server, retrying with exponential backoff if reconnect is True.
+        """
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                if not self.reconnect or self.closed:
+                    raise
+                await self.waitBackoff()
+                continue
+
+            # New connection: incomplete packages from the previous one are discarded
+            self.framer.reset()
+            self.connectionCount += 1
+            return
+
+    async def waitBackoff(self):
+        """ Function that waits before reconnecting (the delay is doubled every time, up to maxBackoff).
+        """
+        await asyncio.sleep(self.backoff)
+        self.backoff = min(self.backoff * 2, self.maxBackoff)
+
+    async def close(self):
+        """ Function that closes the connection (and stops the iterators).
+        """
+        self.closed = True
+        await self.closeConnection()
+
+    async def closeConnection(self):
+        """ Function that closes the current connection (its transport and socket).
+        """
+        writer = self.writer
+        self.reader = None
+        self.writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def packages(self):
+        """ Asynchronous generator that yields every received package as (packageJSON, checksum).
+        """
+        while not self.closed:
+            if self.reader is None:
+                await self.connect()
+            try:
+                data = await self.reader.read(self.readSize)
+            except OSError:
+                data = b''
+
+            if not data:
+                # Connection lost: the old connection is closed before reconnecting
+                await self.closeConnection()
+                if not self.reconnect or self.closed:
+                    return
+                # The backoff also applies here (a server that accepts and closes the connection)
+                await self.waitBackoff()
+                continue
+
+            self.bytesReceived += len(data)
+            self.framer.feed(data)
+            for payload, checksum in self.framer.packages():
+                self.packagesReceived += 1
+                self.backoff = self.initialBackoff
+                yield packageDecoder.decodePackage(payload), checksum
+
+    async def cycles(self):
+        """ Asynchronous generator that yields every complete measurement cycle as
+        (measurementObj, (measurementData, timeData, positionData, posNames, gapSummary)).
+
+        A cycle interrupted by a reconnection is discarded.
+        """
+        measurementObj = self.measurementFactory()
+        measurementStarted = False
+        connectionCount = self.connectionCount
+
+        async for packageJSON, checksum in self.packages():
+            if connectionCount != self.connectionCount:
+                connectionCount = self.connectionCount
+                measurementObj = self.measurementFactory()
+                measurementStarted = False
+
+            measurementStarted, cycleComplete = processPackage(packageJSON, checksum, self.metadataObj, measurementObj, measurementStarted)
+            if cycleComplete:
+                yield measurementObj, measurementObj.getCycle()
+
+                self.metadataObj.resetChecksum() # Force an update on the metadata parameters to avoid problems when changing the config.
+                measurementObj = self.measurementFactory()
+                measurementStarted = False
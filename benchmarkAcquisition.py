@@ -0,0 +1,122 @@
+""" Benchmark suite of the acquisition (getMeasurementCycle) without the Odisi system.
+
+- Fragmentation: complete cycles split in adversarial segments (1-byte segments up to many packages
+  per recv), checking that every sample is received.
+- Throughput: maximum packages/s and gages x samples/s through getMeasurementCycle (no pacing).
+- Sustained rate: a local server (odisiSimulator.serveSynthetic, in another process) measures at
+  increasing rates and drops packages when the client does not keep up, like the Odisi. The maximum
+  rate without sequence loss is reported.
+
+Run with: python3 benchmarkAcquisition.py [--gages N] [--duration S] [--rates R1 R2 ...]
+"""
+
+import io
+import time
+import asyncio
+import argparse
+import contextlib
+import multiprocessing
+import metadataHandler, measurementHandler, odisiSimulator
+from OdisiTCPClient import connectClient, getMeasurementCycle
+
+def runCycle(connectedSocket):
+    """ Function that receives one measurement cycle (hiding the messages of the handlers).
+    Outputs:
+        measurementObj: measurementHandler
+        elapsed: float
+            Time to receive and process the cycle (s).
+    """
+    measurementObj = measurementHandler.measurementHandler()
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        getMeasurementCycle(connectedSocket, metadataHandler.metadataHandler(), measurementObj)
+    return measurementObj, time.perf_counter() - startTime
+
+def benchmarkFragmentation(nGages):
+    """ Function that receives complete cycles split in segments of different sizes.
+    """
+    print('Fragmentation (%i gages)' % nGages)
+    print('%10s %8s %10s %12s %10s' % ('segment', 'samples', 'time (s)', 'packages/s', 'MB/s'))
+    for segmentSize, nSamples in ((1, 20), (7, 50), (1460, 500), (4096, 500), (65536, 2000), (2**30, 2000)):
+        stream = odisiSimulator.syntheticCycle(nSamples, nGages)
+        measurementObj, elapsed = runCycle(odisiSimulator.segmentSocket(stream, segmentSize))
+        if measurementObj.getSampleCount() != nSamples or measurementObj.gaps.lost != 0:
+            raise Exception('Fragmentation error with %i-byte segments: %i samples received' % (segmentSize, measurementObj.getSampleCount()))
+        print('%10i %8i %10.3f %12.0f %10.1f' % (segmentSize, nSamples, elapsed, nSamples / elapsed, len(stream) / elapsed / 1e6))
+
+def benchmarkThroughput(gagesList, nSamples=2000):
+    """ Function that measures the maximum processing throughput (no pacing, 64 KiB segments).
+    """
+    print('Throughput (%i samples, 64 KiB segments)' % nSamples)
+    print('%8s %10s %12s %16s %10s' % ('gages', 'time (s)', 'packages/s', 'gages*samples/s', 'MB/s'))
+    for nGages in gagesList:
+        stream = odisiSimulator.syntheticCycle(nSamples, nGages)
+        measurementObj, elapsed = runCycle(odisiSimulator.segmentSocket(stream, 65536))
+        print('%8i %10.3f %12.0f %16.3g %10.1f' % (nGages, elapsed, nSamples / elapsed, nSamples * nGages / elapsed, len(stream) / elapsed / 1e6))
+
+def runSyntheticServer(portQueue, statsQueue, measurementRate, nGages, duration):
+    """ Function that runs the synthetic Odisi server (in a separate process).
+    """
+    async def serve():
+        stats = {}
+        server = await odisiSimulator.serveSynthetic(measurementRate, nGages, duration, stats=stats)
+        portQueue.put(server.sockets[0].getsockname()[1])
+        # Wait until the whole cycle has been sent (or dropped)
+        while stats['sent'] + stats['dropped'] < int(round(duration * measurementRate)):
+            await asyncio.sleep(0.05)
+        statsQueue.put(stats)
+        await asyncio.sleep(duration + 5)
+    asyncio.run(serve())
+
+def benchmarkSustainedRate(nGages, rates, duration):
+    """ Function that finds the maximum measurement rate the client keeps up with (without sequence loss).
+    """
+    print('Sustained rate (%i gages, %.1f s per rate)' % (nGages, duration))
+    print('%10s %10s %10s %12s %16s' % ('rate (Hz)', 'received', 'lost', 'packages/s', 'gages*samples/s'))
+    maxRate = None
+    for measurementRate in rates:
+        portQueue = multiprocessing.Queue()
+        statsQueue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=runSyntheticServer, args=(portQueue, statsQueue, measurementRate, nGages, duration), daemon=True)
+        server.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                connectedSocket = connectClient('127.0.0.1', portQueue.get(timeout=10))
+            try:
+                measurementObj, elapsed = runCycle(connectedSocket)
+            finally:
+                connectedSocket.close()
+            serverStats = statsQueue.get(timeout=10)
+        finally:
+            server.terminate()
+            server.join()
+
+        received = measurementObj.getSampleCount()
+        # Packages dropped at the end of the cycle are not seen as gaps by the client
+        lost = max(measurementObj.gaps.lost, serverStats['dropped'])
+        print('%10.0f %10i %10i %12.0f %16.3g' % (measurementRate, received, lost, received / duration, received * nGages / duration))
+        if lost > 0:
+            break
+        maxRate = measurementRate
+
+    if maxRate is None:
+        print('Packages were lost at every tested rate')
+    else:
+        print('Maximum sustained rate: %.0f Hz (%.3g gages*samples/s)' % (maxRate, maxRate * nGages))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the Odisi TCP client.')
+    parser.add_argument('--gages', type=int, default=2000, help='Number of gages (default: %(default)s).')
+    parser.add_argument('--duration', type=float, default=3.0, help='Duration of every sustained rate test (default: %(default)s s).')
+    parser.add_argument('--rates', type=float, nargs='+', default=[50, 100, 250, 500, 1000, 2000, 4000],
+                        help='Measurement rates of the sustained rate test (Hz).')
+    args = parser.parse_args()
+
+    benchmarkFragmentation(200)
+    print()
+    benchmarkThroughput([50, 2000, 20000])
+    print()
+    benchmarkSustainedRate(args.gages, args.rates, args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+""" Benchmark of the package framing: parseReceivedData vs packageFramer on synthetic Odisi streams.
+
+Run with: python3 benchmarkFraming.py
+"""
+
+import time
+from OdisiTCPClient import parseReceivedData
+from packageFramer import packageFramer
+import odisiSimulator
+
+def runParseReceivedData(segments):
+    """ Function that frames the segments with parseReceivedData (as the original getMeasurementCycle did).
+    """
+    storedData = b''
+    nPackages = 0
+    for segment in segments:
+        result = parseReceivedData(segment, storedData)
+        packages, storedData, checksums = result if result[0] else ([], result[1], [])
+        for package in packages:
+            package.encode('utf-8')     # The package was already decoded, just touch it
+        nPackages += len(packages)
+    return nPackages
+
+def runPackageFramer(segments):
+    """ Function that frames the segments with packageFramer (decoding every payload once).
+    """
+    framer = packageFramer()
+    nPackages = 0
+    for segment in segments:
+        framer.feed(segment)
+        for payload, checksum in framer.packages():
+            str(payload, 'utf-8')
+            nPackages += 1
+    return nPackages
+
+def timeIt(function, segments, repeats=3):
+    """ Function that returns the best time of several runs and the number of framed packages.
+    """
+    bestTime = float('inf')
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        nPackages = function(segments)
+        bestTime = min(bestTime, time.perf_counter() - startTime)
+    return bestTime, nPackages
+
+def main():
+    # (number of samples, number of gages, TCP segment size)
+    cases = [(2000, 50, 4096),
+             (500, 2000, 4096),
+             (100, 15000, 4096),
+             (100, 15000, 65536)]
+
+    print('%8s %8s %8s %10s | %12s %12s %8s' % ('samples', 'gages', 'segment', 'MB', 'parse (s)', 'framer (s)', 'speedup'))
+    for nSamples, nGages, segmentSize in cases:
+        stream = odisiSimulator.syntheticCycle(nSamples, nGages)
+        segments = odisiSimulator.splitStream(stream, segmentSize)
+
+        parseTime, parsePackages = timeIt(runParseReceivedData, segments)
+        framerTime, framerPackages = timeIt(runPackageFramer, segments)
+        if parsePackages != framerPackages:
+            raise Exception('Different number of packages: %i %i' % (parsePackages, framerPackages))
+
+        print('%8i %8i %8i %10.1f | %12.3f %12.3f %7.1fx' % (nSamples, nGages, segmentSize, len(stream) / 1e6,
+                                                             parseTime, framerTime, parseTime / framerTime))
+
+if __name__ == "__main__":
+    main()
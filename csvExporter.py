@@ -0,0 +1,245 @@
+""" Fast CSV export of large measurement cycles.
+
+The file layout is the one of saveMeasurementsCSV: gage/segment names row (if there are names), X-axis row,
+then one row per sample (time + data), with '\\r\\n' line terminators.
+The rows are formatted in blocks of chunkRows rows:
+    - decimals=None: every value is written with the shortest representation (the same text as the csv module).
+    - decimals=N: fixed-point with N decimals, formatted with vectorized NumPy operations (much faster).
+With workers > 1 the blocks are formatted (and compressed) in parallel in a process pool, and written in order.
+With compression ('gzip', or 'zstd' if the zstandard package is installed), every block is compressed as an
+independent gzip member / zstd frame, so the blocks can be compressed in parallel and the file is still a
+standard .gz / .zst file.
+With info (see measurementHandler.getInfo), a JSON file with the metadata and the sequence gap summary
+(loss rate, gap histogram...) is written next to the CSV file (same name, with the .json extension).
+"""
+
+import csv
+import gzip
+import time
+import io
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from measurementHandler import formatTimestamps
+from streamWriter import writeInfo
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def roundScaled(values, scale):
+    """ Function that returns round(values * scale) for non-negative values, rounding as '%f' does (with the
+    exact binary value, half to even): the product is rounded, so the ties are checked with its exact error.
+    """
+    product = values * scale
+    scaled = np.floor(product)
+    remainder = product - scaled
+    roundUp = remainder > 0.5
+    ties = np.flatnonzero(remainder == 0.5)
+    if len(ties):
+        # Exact error of the product (Dekker's algorithm)
+        a = values.ravel()[ties]
+        split = 134217729.0 * a
+        aHigh = split - (split - a)
+        aLow = a - aHigh
+        split = 134217729.0 * scale
+        bHigh = split - (split - scale)
+        bLow = scale - bHigh
+        tieProduct = product.ravel()[ties]
+        error = ((aHigh * bHigh - tieProduct) + aHigh * bLow + aLow * bHigh) + aLow * bLow
+        tieScaled = scaled.ravel()[ties]
+        roundUp.ravel()[ties] = (error > 0) | ((error == 0) & (tieScaled % 2 == 1))
+    return scaled + roundUp
+
+def formatFixed(values, decimals):
+    """ Function that formats a 2D float array with a fixed number of decimals (like '%.Nf'), vectorized.
+    Outputs:
+        chars: np.ndarray (uint8)
+            Characters of every value, followed by a separator column (n x gages x width).
+        mask: np.ndarray (bool)
+            Characters to keep (the unused leading positions are False).
+    """
+    finite = np.isfinite(values)
+    absolute = np.where(finite, np.abs(values), 0.0)
+    scale = 10 ** decimals
+    scaled = roundScaled(absolute, scale)
+    # Smaller integers are faster to split into digits
+    scaled = scaled.astype(np.int32 if scaled.size == 0 or scaled.max() < 2 ** 31 else np.int64)
+    intPart, fracPart = np.divmod(scaled, scale)
+
+    maxInt = int(intPart.max()) if intPart.size else 0
+    intDigits = max(len(str(maxInt)), 1 if finite.all() else 3)
+    fracWidth = decimals + 1 if decimals > 0 else 0
+    width = 1 + intDigits + fracWidth + 1
+    chars = np.empty(values.shape + (width,), dtype=np.uint8)
+    mask = np.ones(values.shape + (width,), dtype=bool)
+
+    # Sign
+    chars[..., 0] = ord('-')
+    np.logical_and(np.signbit(values), finite, out=mask[..., 0])
+
+    # Integer digits, from the right (the leading zeros are removed, but the units digit is always kept)
+    for i in reversed(range(intDigits)):
+        intPart, digit = np.divmod(intPart, 10)
+        chars[..., 1 + i] = digit
+        if i < intDigits - 1:
+            np.greater_equal(scaled, 10 ** (intDigits - 1 - i) * scale, out=mask[..., 1 + i])
+
+    chars[..., 1:1 + intDigits] += ord('0')
+
+    # Decimals
+    if decimals > 0:
+        chars[..., 1 + intDigits] = ord('.')
+        for i in reversed(range(decimals)):
+            fracPart, digit = np.divmod(fracPart, 10)
+            chars[..., 2 + intDigits + i] = digit
+        chars[..., 2 + intDigits:-1] += ord('0')
+    chars[..., -1] = ord(',')
+
+    # Non-finite values: 'nan', 'inf' or '-inf'
+    if not finite.all():
+        special = ~finite
+        mask[special, :-1] = False
+        for text, selection in ((b'nan', np.isnan(values)), (b'inf', np.isinf(values))):
+            chars[selection, 1:4] = np.frombuffer(text, dtype=np.uint8)
+            mask[selection, 1:4] = True
+        mask[..., 0] |= np.isneginf(values)
+    return chars, mask
+
+def formatRows(measurementData, timeData, withDate=False, decimals=None):
+    """ Function that formats data rows (time + data) as CSV text.
+    Outputs:
+        text: bytes
+    """
+    measurementData = np.asarray(measurementData, dtype=np.float64)
+    timeStrings = formatTimestamps(timeData, withDate)
+    nRows = len(timeStrings)
+    if nRows == 0:
+        return b''
+    fixedPoint = decimals is not None and measurementData.shape[1] > 0
+    if fixedPoint:
+        # Values too large for int64 fixed-point are written with the shortest representation
+        finiteValues = measurementData[np.isfinite(measurementData)]
+        fixedPoint = finiteValues.size == 0 or np.abs(finiteValues).max() * 10 ** decimals < 2 ** 62
+    if not fixedPoint:
+        # Shortest representation (repr of every value, like the csv module)
+        separator = ',' if measurementData.shape[1] else ''
+        return ''.join([timeString + separator + ','.join(map(repr, row)) + '\r\n'
+                        for timeString, row in zip(timeStrings.tolist(), measurementData.tolist())]).encode()
+
+    chars, mask = formatFixed(measurementData, decimals)
+    chars = chars.reshape(nRows, -1)
+    mask = mask.reshape(nRows, -1)
+    # Time column + ',' at the start, and '\r\n' at the end of every row (instead of the last ',')
+    timeChars = np.frombuffer(timeStrings.astype('S').tobytes(), dtype=np.uint8).reshape(nRows, -1)
+    chars[:, -1] = ord('\r')
+    rowChars = np.hstack((timeChars, np.full((nRows, 1), ord(','), dtype=np.uint8), chars,
+                          np.full((nRows, 1), ord('\n'), dtype=np.uint8)))
+    rowMask = np.hstack((np.ones((nRows, timeChars.shape[1] + 1), dtype=bool), mask, np.ones((nRows, 1), dtype=bool)))
+    return rowChars[rowMask].tobytes()
+
+def compressBlock(data, compression):
+    """ Function that compresses a block as an independent gzip member or zstd frame.
+    """
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    return zstandard.ZstdCompressor().compress(data)
+
+def exportBlock(measurementData, timeData, withDate, decimals, compression):
+    """ Function that formats and compresses a block (it runs in the process pool).
+    Outputs:
+        data: bytes
+        textSize: int
+            Size of the uncompressed text.
+    """
+    text = formatRows(measurementData, timeData, withDate, decimals)
+    return compressBlock(text, compression), len(text)
+
+def formatHeader(positionData, positionNames):
+    """ Function that formats the header rows (gage/segment names and X-axis), as saveMeasurementsCSV.
+    """
+    headerText = io.StringIO()
+    writer = csv.writer(headerText)
+    if len(positionNames) != 0:
+        writer.writerow(['Gage/Segment Name'] + [str(name) for name in positionNames])
+    writer.writerow(['X-axis'] + [f'{pos:.2f}' for pos in positionData])
+    return headerText.getvalue().encode()
+
+def exportCSV(measurementData, timeData, positionData, positionNames, filename, withDate=False, decimals=None,
+              compression=None, workers=1, chunkRows=None, info=None):
+    """ Function that saves a measurement cycle to a CSV file.
+    Inputs:
+        decimals: int
+            Number of decimals of the data (None for the shortest representation of every value).
+        compression: str
+            None, 'gzip' or 'zstd' (the extension is added to the filename).
+        workers: int
+            Number of processes formatting the blocks (1 to format them in this process).
+        chunkRows: int
+            Rows per block (by default, blocks of about 2 million values).
+        info: dict
+            Information of the measurement (see measurementHandler.getInfo), saved as a JSON file (None for no file).
+    Outputs:
+        stats: dict
+            'filename', 'info filename' (None without info), 'rows', 'text bytes' (uncompressed), 'file bytes',
+            'seconds' and 'MB/s' (of text).
+    """
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise Exception('Unknown compression %s!' % compression)
+    if compression == 'zstd' and zstandard is None:
+        raise Exception('zstd compression requires the zstandard package!')
+    if not filename.endswith('.csv') and not filename.endswith('.csv' + COMPRESSION_EXTENSIONS[compression]):
+        filename += '.csv'
+    if not filename.endswith(COMPRESSION_EXTENSIONS[compression]):
+        filename += COMPRESSION_EXTENSIONS[compression]
+
+    startTime = time.perf_counter()
+    measurementData = np.asarray(measurementData)
+    nRows = len(timeData)
+    if chunkRows is None:
+        chunkRows = max(1, 2000000 // max(measurementData.shape[1] if measurementData.ndim == 2 else 1, 1))
+    blocks = [(measurementData[start:start + chunkRows], timeData[start:start + chunkRows])
+              for start in range(0, nRows, chunkRows)]
+
+    header = formatHeader(positionData, positionNames)
+    textBytes = len(header)
+    fileBytes = 0
+    with open(filename, 'wb') as csvFile:
+        headerData = compressBlock(header, compression)
+        csvFile.write(headerData)
+        fileBytes += len(headerData)
+        if workers > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Only a few blocks are pending at a time (so the formatted text is not all kept in memory)
+                pending = []
+                for block in blocks:
+                    pending.append(executor.submit(exportBlock, block[0], block[1], withDate, decimals, compression))
+                    if len(pending) > 2 * workers:
+                        data, textSize = pending.pop(0).result()
+                        csvFile.write(data)
+                        fileBytes += len(data)
+                        textBytes += textSize
+                for future in pending:
+                    data, textSize = future.result()
+                    csvFile.write(data)
+                    fileBytes += len(data)
+                    textBytes += textSize
+        else:
+            for block in blocks:
+                data, textSize = exportBlock(block[0], block[1], withDate, decimals, compression)
+                csvFile.write(data)
+                fileBytes += len(data)
+                textBytes += textSize
+
+    infoFilename = None
+    if info is not None:
+        infoFilename = filename[:len(filename) - len('.csv' + COMPRESSION_EXTENSIONS[compression])] + '.json'
+        writeInfo(infoFilename, dict(info, rows=nRows))
+
+    elapsed = time.perf_counter() - startTime
+    return {'filename': filename, 'info filename': infoFilename, 'rows': nRows, 'text bytes': textBytes, 'file bytes': fileBytes,
+            'seconds': elapsed, 'MB/s': textBytes / elapsed / 1e6 if elapsed > 0 else 0.0}
@@ -0,0 +1,257 @@
+""" Live fan-out of the stored rows to local subscribers (dashboards, loggers...), while measuring.
+
+Every row is encoded only once, as a binary frame, and the same frame is queued for every subscriber.
+Each subscriber has its own bounded queue and sender thread: when a subscriber does not keep up, its
+frames are dropped (the oldest or the newest ones, see dropPolicy), so the acquisition is never stalled.
+
+Frame: FRAME_HEADER (magic, frame type, channel, payload size, timestamp, frame number) + payload
+    FRAME_START: JSON with the positions, names and number of gages of the channel (sent at the start of the
+                 cycle, and to every new subscriber).
+    FRAME_DATA: the row as little-endian float32 (timestamp in microseconds since the epoch).
+    FRAME_END: JSON with the number of published and dropped frames (end of the cycle).
+
+Example:
+    server = fanoutServer(('127.0.0.1', 50001))
+    measurementObj = measurementHandler(listeners=[server.publisher()])
+    # In other processes:
+    for frameType, channel, timestamp, number, payload in fanoutSubscriber(('127.0.0.1', 50001)).frames(): ...
+"""
+
+import os
+import json
+import queue
+import socket
+import struct
+import threading
+import numpy as np
+
+FRAME_MAGIC = b'ODSF'
+FRAME_HEADER = struct.Struct('<4sBxHIqQ')
+FRAME_START = 1
+FRAME_DATA = 2
+FRAME_END = 3
+
+def encodeFrame(frameType, channel, timestamp, number, payload):
+    """ Function that encodes a frame (header + payload bytes).
+    """
+    return FRAME_HEADER.pack(FRAME_MAGIC, frameType, channel, len(payload), timestamp, number) + payload
+
+def createSocket(address):
+    """ Function that creates a socket for the address: a path (str) for a Unix socket, or (host, port) for TCP.
+    """
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+def removeStaleSocket(path):
+    """ Function that removes a Unix socket file left by a previous run (only if no server is listening on it).
+    """
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    except OSError:
+        # Not a socket: bind reports the error
+        pass
+    else:
+        raise OSError('A server is already listening on %s' % path)
+    finally:
+        probe.close()
+
+class subscriberConnection:
+    """ Subscriber connection class (bounded queue + sender thread)
+    """
+    def __init__(self, connectedSocket, queueSize, dropPolicy):
+        self.connectedSocket = connectedSocket
+        self.frames = queue.Queue(maxsize=queueSize)
+        self.dropPolicy = dropPolicy
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def offer(self, frame):
+        """ Function that queues a frame without blocking (dropping a frame if the queue is full).
+        """
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropPolicy == 'oldest':
+                try:
+                    self.frames.get_nowait()
+                    self.frames.put_nowait(frame)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def run(self):
+        """ Function that sends the queued frames (in its own thread).
+        """
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                self.connectedSocket.sendall(frame)
+                self.sent += 1
+        except OSError:
+            pass
+        self.closed = True
+        self.connectedSocket.close()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.frames.put_nowait(None)
+        except queue.Full:
+            # The sender thread is stuck sending: closing the socket ends it
+            self.connectedSocket.close()
+
+class fanoutPublisher:
+    """ Publisher class: measurementHandler listener that publishes the rows of a channel (see fanoutServer.publisher).
+    """
+    def __init__(self, server, channel=1):
+        self.server = server
+        self.channel = channel
+        self.number = 0
+
+    def start(self, position, posNames):
+        self.number = 0
+        info = {'positions': np.asarray(position).tolist(), 'names': list(posNames), 'gages': len(position)}
+        frame = encodeFrame(FRAME_START, self.channel, 0, 0, json.dumps(info).encode())
+        self.server.startFrames[self.channel] = frame
+        self.server.publish(frame)
+
+    def processRow(self, row, timestamp):
+        self.number += 1
+        payload = np.asarray(row, dtype='<f4').tobytes()
+        self.server.publish(encodeFrame(FRAME_DATA, self.channel, timestamp, self.number, payload))
+
+    def finish(self):
+        info = {'frames': self.number, 'dropped': self.server.getDropped()}
+        self.server.publish(encodeFrame(FRAME_END, self.channel, 0, self.number, json.dumps(info).encode()))
+        self.server.startFrames.pop(self.channel, None)
+
+class fanoutServer:
+    """ Fan-out server class
+
+    Inputs:
+        address: str or tuple
+            Path of a Unix socket, or (host, port) of a TCP socket (use a local address).
+        queueSize: int
+            Maximum number of queued frames per subscriber.
+        dropPolicy: str
+            'oldest' (the subscriber gets the most recent rows) or 'newest' (the new frames are dropped).
+    """
+    def __init__(self, address=('127.0.0.1', 50001), queueSize=1000, dropPolicy='oldest'):
+        if dropPolicy not in ('oldest', 'newest'):
+            raise Exception('Unknown drop policy %s!' % dropPolicy)
+        self.queueSize = queueSize
+        self.dropPolicy = dropPolicy
+        self.subscribers = []
+        self.startFrames = {}       # Channel -> start frame of the current cycle (sent to new subscribers)
+        self.lock = threading.Lock()
+
+        self.socketPath = address if isinstance(address, str) else None
+        self.serverSocket = createSocket(address)
+        if self.socketPath is None:
+            self.serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            removeStaleSocket(self.socketPath)
+        self.serverSocket.bind(address)
+        self.serverSocket.listen()
+        self.address = self.serverSocket.getsockname()
+        self.thread = threading.Thread(target=self.acceptSubscribers, daemon=True)
+        self.thread.start()
+
+    def publisher(self, channel=1):
+        """ Function that returns a measurementHandler listener that publishes the rows of a channel.
+        """
+        return fanoutPublisher(self, channel)
+
+    def acceptSubscribers(self):
+        """ Function that accepts the subscribers (in its own thread).
+        """
+        while True:
+            try:
+                connectedSocket, _ = self.serverSocket.accept()
+            except OSError:
+                return
+            subscriber = subscriberConnection(connectedSocket, self.queueSize, self.dropPolicy)
+            with self.lock:
+                for frame in self.startFrames.values():
+                    subscriber.offer(frame)
+                self.subscribers.append(subscriber)
+
+    def publish(self, frame):
+        """ Function that queues a frame for every subscriber (the same bytes object is shared).
+        """
+        with self.lock:
+            if any(subscriber.closed for subscriber in self.subscribers):
+                self.subscribers = [subscriber for subscriber in self.subscribers if not subscriber.closed]
+            for subscriber in self.subscribers:
+                subscriber.offer(frame)
+
+    def getDropped(self):
+        """ Function that returns the number of dropped frames of every (connected) subscriber.
+        """
+        with self.lock:
+            return [subscriber.dropped for subscriber in self.subscribers]
+
+    def close(self):
+        """ Function that stops the server and disconnects the subscribers.
+        """
+        self.serverSocket.close()
+        if self.socketPath is not None:
+            try:
+                os.unlink(self.socketPath)
+            except FileNotFoundError:
+                pass
+            self.socketPath = None
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.close()
+            self.subscribers = []
+
+class fanoutSubscriber:
+    """ Subscriber class (client of the fanoutServer)
+    """
+    def __init__(self, address=('127.0.0.1', 50001)):
+        self.connectedSocket = createSocket(address)
+        self.connectedSocket.connect(address)
+
+    def receiveExactly(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            nBytes = self.connectedSocket.recv_into(view[received:])
+            if nBytes == 0:
+                raise ConnectionError('Connection closed by the fan-out server')
+            received += nBytes
+        return buffer
+
+    def frames(self):
+        """ Generator that yields the received frames as (frame type, channel, timestamp, frame number, payload).
+        The payload is a float32 array for FRAME_DATA, and a dictionary for FRAME_START and FRAME_END.
+        """
+        while True:
+            try:
+                header = self.receiveExactly(FRAME_HEADER.size)
+            except ConnectionError:
+                return
+            magic, frameType, channel, size, timestamp, number = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC:
+                raise Exception('Invalid fan-out frame!')
+            payload = self.receiveExactly(size)
+            if frameType == FRAME_DATA:
+                yield frameType, channel, timestamp, number, np.frombuffer(payload, dtype='<f4')
+            else:
+                yield frameType, channel, timestamp, number, json.loads(payload.decode())
+
+    def close(self):
+        self.connectedSocket.close()
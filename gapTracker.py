@@ -0,0 +1,62 @@
+import numpy as np
+
+class gapTracker:
+    """ Sequence gap tracker class
+
+    Follows the sequence numbers of the measurement packages and records every gap as
+    (expected sequence number, received sequence number, stored row index), without raising exceptions,
+    so the package that reveals the gap is kept.
+    The stored row index is the index of the first row stored after the gap (in the saved data): it counts the
+    stored rows, so it includes the NaN rows of the filled gaps and, with a processing stage, it counts the
+    decimated rows (the gap is inside the decimation block of that row).
+    """
+    def __init__(self):
+        self.expected = None        # Next expected sequence number (None before the first package)
+        self.received = 0           # Number of received packages
+        self.lost = 0               # Number of lost packages
+        self.gaps = []              # (expected, received, stored row index) of every gap
+
+    def update(self,sequenceNumber,rowIndex):
+        """ Function that checks a new sequence number.
+        Outputs:
+            missing: int
+                Number of packages lost just before this one (0 if there is no gap, or if the sequence restarted).
+        """
+        self.received += 1
+        missing = 0
+        if self.expected is not None and sequenceNumber != self.expected:
+            # A smaller sequence number means the Odisi restarted the sequence: it is recorded, but nothing is lost
+            missing = max(sequenceNumber - self.expected, 0)
+            self.lost += missing
+            self.gaps.append((self.expected, sequenceNumber, rowIndex))
+        self.expected = sequenceNumber + 1
+        return missing
+
+    def getLossRate(self):
+        """ Function that returns the fraction of lost packages.
+        """
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+    def getHistogram(self):
+        """ Function that returns the histogram of the gap sizes (number of lost packages per gap).
+        Outputs:
+            sizes: np.ndarray
+                Different gap sizes.
+            counts: np.ndarray
+                Number of gaps of each size.
+        """
+        if not self.gaps:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        gapArray = np.asarray(self.gaps, dtype=np.int64)
+        return np.unique(np.maximum(gapArray[:, 1] - gapArray[:, 0], 0), return_counts=True)
+
+    def getSummary(self):
+        """ Function that returns the gap statistics as a dictionary (e.g. to be saved with the data).
+        """
+        sizes, counts = self.getHistogram()
+        return {'received packages': self.received,
+                'lost packages': self.lost,
+                'loss rate': self.getLossRate(),
+                'gaps (expected, received, stored row index)': [list(gap) for gap in self.gaps],
+                'gap histogram (size: count)': {int(size): int(count) for size, count in zip(sizes, counts)}}
@@ -0,0 +1,203 @@
+""" Optional instrumentation of the acquisition (latency per stage, throughput, queue depths, sequence gaps).
+
+It is disabled by default (recorder is None): the instrumented functions only check it, so the overhead is
+negligible. When enabled (enable()), every stage records its latency (nanoseconds) in a log2 histogram:
+    'recv'          waiting for data in getMeasurementCycle (socket stalls, or the receiver thread)
+    'socket recv'   socket recv_into in the acquisitionPipeline receiver thread
+    'framing'       splitting the received bytes into packages (packageFramer)
+    'decode'        JSON / data array decoding (packageDecoder)
+    'metadata'      metadataHandler.processMetadata
+    'measurement'   measurementHandler.processMeasurement
+    'flush'         writing a block to disk (streamWriter)
+    'empty buffer'  gathering the stored blocks at the end of the cycle
+    'parse'         parseReceivedData
+Counters, gauges and the recv sizes are also recorded. The metrics are available with snapshot(),
+or in Prometheus text format (toPrometheus, or startMetricsServer for a local HTTP endpoint).
+
+Example:
+    instrumentation.enable()
+    instrumentation.startMetricsServer(9100)    # http://127.0.0.1:9100/metrics
+"""
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+recorder = None     # metricsRecorder when the instrumentation is enabled
+
+HISTOGRAM_BUCKETS = 48
+LATENCY_BOUNDS = range(10, 36, 2)       # Prometheus buckets: 2^10 ns (~1 us) to 2^34 ns (~17 s)
+SIZE_BOUNDS = range(6, 24, 2)           # Prometheus buckets: 64 B to 8 MiB
+
+def enable():
+    """ Function that enables the instrumentation (a new recorder is created).
+    """
+    global recorder
+    recorder = metricsRecorder()
+    return recorder
+
+def disable():
+    global recorder
+    recorder = None
+
+class log2Histogram:
+    """ Histogram with power-of-two buckets (the bucket of a value is its bit length), O(1) per value.
+    """
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.buckets[min(value.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """ Function that returns an upper bound of the quantile (the upper limit of its bucket).
+        """
+        if self.count == 0:
+            return 0
+        target = fraction * self.count
+        cumulative = 0
+        for bucket, bucketCount in enumerate(self.buckets):
+            cumulative += bucketCount
+            if cumulative >= target:
+                return min(2 ** bucket, self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """ Function that returns the cumulative counts of the values below 2**bound, for every bound.
+        """
+        counts = []
+        cumulative = 0
+        index = 0
+        for bound in bounds:
+            while index <= bound and index < HISTOGRAM_BUCKETS:
+                cumulative += self.buckets[index]
+                index += 1
+            counts.append(cumulative)
+        return counts
+
+    def getSummary(self, scale=1.0):
+        return {'count': self.count, 'mean': self.total / self.count * scale if self.count else 0.0,
+                'p50': self.quantile(0.5) * scale, 'p99': self.quantile(0.99) * scale, 'max': self.max * scale}
+
+class metricsRecorder:
+    """ Metrics recorder class
+
+    The values are updated without locks (the GIL makes every update safe enough for monitoring purposes).
+    """
+    def __init__(self):
+        self.startTime = time.monotonic()
+        self.latencies = {}         # Stage -> log2Histogram (nanoseconds)
+        self.sizes = {}             # Name -> log2Histogram (bytes)
+        self.counters = {}
+        self.gauges = {}
+        self.gaugeFunctions = {}    # Name -> function returning the value (evaluated only by snapshot)
+        self.lastSnapshot = (self.startTime, {})
+
+    def observe(self, stage, nanoseconds):
+        histogram = self.latencies.get(stage)
+        if histogram is None:
+            histogram = self.latencies[stage] = log2Histogram()
+        histogram.observe(nanoseconds)
+
+    def observeSize(self, name, size):
+        histogram = self.sizes.get(name)
+        if histogram is None:
+            histogram = self.sizes[name] = log2Histogram()
+        histogram.observe(size)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def setGauge(self, name, value):
+        self.gauges[name] = value
+
+    def addGauge(self, name, function):
+        """ Function that adds a gauge whose value is obtained when the metrics are read (e.g. a queue size).
+        """
+        self.gaugeFunctions[name] = function
+
+    def getGauges(self):
+        gauges = dict(self.gauges)
+        for name, function in list(self.gaugeFunctions.items()):
+            try:
+                gauges[name] = function()
+            except Exception:
+                pass
+        return gauges
+
+    def snapshot(self):
+        """ Function that returns the current metrics.
+        Outputs:
+            metrics: dict
+                'uptime (s)', 'counters', 'rates (per second)' (since the previous snapshot), 'gauges',
+                'latency (us)' (count, mean, p50, p99 and max of every stage) and 'sizes (bytes)'.
+        """
+        now = time.monotonic()
+        counters = dict(self.counters)
+        lastTime, lastCounters = self.lastSnapshot
+        elapsed = max(now - lastTime, 1e-9)
+        rates = {name: (value - lastCounters.get(name, 0)) / elapsed for name, value in counters.items()}
+        self.lastSnapshot = (now, counters)
+        return {'uptime (s)': now - self.startTime,
+                'counters': counters,
+                'rates (per second)': rates,
+                'gauges': self.getGauges(),
+                'latency (us)': {stage: histogram.getSummary(1e-3) for stage, histogram in list(self.latencies.items())},
+                'sizes (bytes)': {name: histogram.getSummary() for name, histogram in list(self.sizes.items())}}
+
+    def toPrometheus(self):
+        """ Function that returns the metrics in Prometheus text format.
+        """
+        def metricName(name):
+            return 'odisi_' + ''.join(c if c.isalnum() else '_' for c in name.lower())
+
+        lines = ['# TYPE odisi_uptime_seconds gauge', 'odisi_uptime_seconds %.3f' % (time.monotonic() - self.startTime)]
+        for name, value in sorted(self.counters.items()):
+            lines += ['# TYPE %s_total counter' % metricName(name), '%s_total %d' % (metricName(name), value)]
+        for name, value in sorted(self.getGauges().items()):
+            lines += ['# TYPE %s gauge' % metricName(name), '%s %s' % (metricName(name), float(value))]
+
+        for metric, histograms, bounds, scale, label in (
+                ('odisi_stage_latency_seconds', self.latencies, LATENCY_BOUNDS, 1e-9, 'stage'),
+                ('odisi_size_bytes', self.sizes, SIZE_BOUNDS, 1, 'name')):
+            if not histograms:
+                continue
+            lines.append('# TYPE %s histogram' % metric)
+            for name, histogram in sorted(list(histograms.items())):
+                for bound, count in zip(bounds, histogram.cumulative(bounds)):
+                    lines.append('%s_bucket{%s="%s",le="%g"} %d' % (metric, label, name, 2 ** bound * scale, count))
+                lines.append('%s_bucket{%s="%s",le="+Inf"} %d' % (metric, label, name, histogram.count))
+                lines.append('%s_sum{%s="%s"} %g' % (metric, label, name, histogram.total * scale))
+                lines.append('%s_count{%s="%s"} %d' % (metric, label, name, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+class metricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics') or recorder is None:
+            self.send_error(404)
+            return
+        body = recorder.toPrometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # No messages for every request
+        pass
+
+def startMetricsServer(port=9100, host='127.0.0.1'):
+    """ Function that serves the metrics (Prometheus text format) on http://host:port/metrics, in a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), metricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metricsServer', daemon=True).start()
+    return server
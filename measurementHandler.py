@@ -1,69 +1,188 @@
+import math
+import time
+import calendar
+import instrumentation
 import numpy as np
+from sampleStore import sampleStore
+from gapTracker import gapTracker
+
+def formatTimestamps(timeData, withDate=False):
+    """ Function that formats the timestamps (epoch microseconds) as strings, for exporting.
+    Inputs:
+        timeData: np.ndarray (int64)
+            Timestamps in microseconds since the epoch (as stored by measurementHandler).
+        withDate: bool
+            If True, the format is 'YYYY-MM-DD HH:MM:SS.ffffff', otherwise 'HH:MM:SS.ffffff'.
+    Outputs:
+        timeStrings: np.ndarray (str)
+    """
+    timeStrings = np.datetime_as_string(np.asarray(timeData, dtype=np.int64).astype('datetime64[us]'))
+    if len(timeStrings) == 0:
+        return timeStrings
+    # Vectorized slicing of the fixed-width 'YYYY-MM-DDTHH:MM:SS.ffffff' strings
+    timeChars = timeStrings.astype('S26').view('S1').reshape(len(timeStrings), 26)
+    if withDate:
+        timeChars = timeChars.copy()
+        timeChars[:, 10] = b' '
+        return timeChars.view('S26').ravel().astype('U26')
+    return np.ascontiguousarray(timeChars[:, 11:]).view('S15').ravel().astype('U15')
+
+def sampleIntervals(timeData):
+    """ Function that returns the interval between consecutive samples (microseconds).
+    """
+    return np.diff(np.asarray(timeData, dtype=np.int64))
+
+def findTimeGaps(timeData, measurementRate, tolerance=0.5):
+    """ Function that finds the intervals that deviate from the nominal sampling period.
+    Inputs:
+        timeData: np.ndarray (int64)
+            Timestamps in microseconds since the epoch.
+        measurementRate: float
+            Nominal measurement rate (Hz).
+        tolerance: float
+            Allowed deviation, as a fraction of the nominal period.
+    Outputs:
+        gapIndex: np.ndarray
+            Index of the sample before each irregular interval.
+        missingSamples: np.ndarray
+            Estimated number of dropped samples in each irregular interval (0 means jitter only).
+        jitter: float
+            Standard deviation of the intervals (microseconds).
+    """
+    intervals = sampleIntervals(timeData)
+    if len(intervals) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0.0
+    period = 1e6 / measurementRate
+    gapIndex = np.flatnonzero(np.abs(intervals - period) > tolerance * period)
+    missingSamples = np.maximum(np.rint(intervals[gapIndex] / period).astype(np.int64) - 1, 0)
+    return gapIndex, missingSamples, float(np.std(intervals))
 
 class measurementHandler:
     """ Measurement class
+
+    keepSeconds > 0 keeps only the last keepSeconds of data (bounded ring buffer for monitoring),
+    otherwise the whole measurement cycle is kept.
+    With a writer (see streamWriter), every full block is written to disk and only one block is kept
+    in memory, so the memory use does not depend on the length of the measurement.
+    With fillGaps, NaN rows are inserted for the lost packages (up to maxFill rows per gap),
+    so the time base stays uniform.
+    With a processing stage (see processingStage), only the region of interest is stored, decimated.
+    Listeners (e.g. streamingStats) receive every stored row while measuring: they are objects with
+    start(position, posNames), processRow(row, timestamp) and finish() functions.
+    With a shared ring (see sharedRingBuffer), every stored row is also copied into shared memory (the last
+    ring size rows are kept there), so other processes can read them while measuring. The stores (or the
+    writer) still keep the whole cycle.
     """
-    def __init__(self):
-        self.measurement = np.array([])     # Can be obtained from measurement[data]
+    def __init__(self, blockSize=1000, keepSeconds=0, writer=None, fillGaps=False, maxFill=1000, processing=None,
+                 listeners=None, sharedRing=None):
+        self.measurement = np.array([])     # Can be obtained from measurement[data] (filled by emptyBuffer)
         self.sequenceNumber = 0     # Can be obtained from measurement[sequence number]     
+        self.lostPackages = 0       # Number of lost packages (according to the sequence number)
+        self.gaps = gapTracker()    # Gaps in the sequence numbers
+        self.fillGaps = fillGaps
+        self.maxFill = maxFill
+        self.filledRows = 0         # Number of NaN rows inserted for lost packages
+        self.lastTimestamp = None
         
         self.position = []          # Can be obtained from metadata[gage pitch]*measurement[number of gages]        
-        self.time = [] 
+        self.time = np.zeros(0, dtype=np.int64)    # Timestamps (microseconds since the epoch, filled by emptyBuffer)
         self.gagesNumber = 0        
         self.posNames = []
 
-        self.bufferSize = 0 
-        self.buffer = np.zeros([])
-        self.bufferIndex = 0       
+        self.bufferSize = blockSize         # Rows per storage block
+        self.keepSeconds = keepSeconds
+        self.store = None                   # sampleStore with the measurement rows (allocated with the first package)
+        self.timeStore = None               # sampleStore with the timestamps
+        self.dayKey = None                  # (year, month, day) of the last package
+        self.dayStart = 0                   # Timestamp of the start of that day (microseconds)
+        self.writer = writer                # Stream writer (None to keep the whole cycle in memory)
+        self.metadataInfo = {}              # Metadata parameters of the cycle (see metadataHandler.getInfo)
+        self.processing = processing        # Processing stage (None to store every gage of every sample)
+        self.listeners = list(listeners) if listeners else []     # Receive every stored row (see streamingStats)
+        self.sharedRing = sharedRing        # Shared ring buffer with a copy of the last rows (None if not used)
            
     def checkSequenceNumber(self,newSequenceN):
         """ Function that checks if a package has been lost using the sequence number value
+        Outputs:
+            missing: int
+                Number of lost packages before this one.
         """
-        if self.sequenceNumber == 0:
-            self.sequenceNumber = newSequenceN
-        elif newSequenceN == (self.sequenceNumber + 1) and self.sequenceNumber != 0:
-            self.sequenceNumber = newSequenceN
-        else:
+        # Index of the next stored row (not of the received sample, see gapTracker)
+        rowIndex = self.store.count if self.store is not None else 0
+        missing = self.gaps.update(newSequenceN, rowIndex)
+        if self.sequenceNumber != 0 and newSequenceN != self.sequenceNumber + 1:
             # For some reason some packages are lost, but is really rare.
             print("Package lost! %i %i" % (self.sequenceNumber, newSequenceN))
-            self.sequenceNumber = newSequenceN
-            raise Exception('Sequence number error!')
+            if instrumentation.recorder is not None:
+                instrumentation.recorder.count('sequence gaps')
+                instrumentation.recorder.count('lost packages', missing)
+        self.lostPackages = self.gaps.lost
+        self.sequenceNumber = newSequenceN
+        return missing
 
     def emptyBuffer(self):
-        """ Function that empties the buffer
+        """ Function that gathers all the stored blocks into self.measurement (only once, at the end of the cycle)
+        """
+        recorder = instrumentation.recorder
+        startTime = time.perf_counter_ns() if recorder is not None else 0
+        if self.processing is not None and self.store is not None:
+            # Rows of the last (incomplete) decimation block
+            for row, timestamp in self.processing.flush():
+                self.storeRow(row, timestamp)
+        if self.writer is not None:
+            # Write the rows stored since the last full block and finish the files
+            if self.store is not None and self.store.count > self.writer.rowCount:
+                self.flushBlock()
+            self.writer.close(self.getInfo())
+            self.measurement = np.zeros((0, self.gagesNumber))
+            self.time = np.zeros(0, dtype=np.int64)
+        elif self.store is not None:
+            self.measurement = self.store.toArray()
+            self.time = self.timeStore.toArray()
+        for listener in self.listeners:
+            listener.finish()
+        if self.sharedRing is not None:
+            self.sharedRing.finish()
+        if recorder is not None:
+            recorder.observe('empty buffer', time.perf_counter_ns() - startTime)
+
+    def getSampleCount(self):
+        """ Function that returns the number of received samples (measurement packages) in the cycle.
+        """
+        return self.gaps.received
+
+    def getInfo(self):
+        """ Function that returns the information needed to interpret the stored data (positions, names and metadata).
+        """
+        info = {'positions': self.position, 'names': self.posNames, 'metadata': self.metadataInfo,
+                'sequence gaps': self.gaps.getSummary(), 'filled rows': self.filledRows}
+        if self.processing is not None:
+            info['processing'] = self.processing.getInfo()
+        return info
+
+    def getCycle(self):
+        """ Function that returns the measurement cycle as (measurementData, timeData, positionData, posNames, gapSummary).
+        """
+        return self.measurement, self.time, self.position, self.posNames, self.gaps.getSummary()
+
+    def getTimestamp(self,newData):
+        """ Function that returns the package timestamp as microseconds since the epoch.
+
+        The Odisi sends its local time, which is stored as it is (no time zone conversion).
         """
-        if self.bufferIndex > 0:
-            # Append the non-empty part of the buffer to self.measurement
-            self.measurement = np.vstack((self.measurement, self.buffer[:self.bufferIndex]))
-            self.bufferIndex = 0
+        dayKey = (newData['year'], newData['month'], newData['day'])
+        if dayKey != self.dayKey:
+            # The start of the day is only computed when the date changes
+            self.dayKey = dayKey
+            self.dayStart = calendar.timegm(dayKey + (0, 0, 0)) * 1000000
+        return (self.dayStart + ((newData['hours'] * 60 + newData['minutes']) * 60 + newData['seconds']) * 1000000
+                + newData['milliseconds'] * 1000 + newData['microseconds'])
 
     def setPositionArray(self,newData,metadata):
         """ Function to get the position array from the metadata"""
-        # Check for the 3 possible cases of position vector:
-        # 1. Full fiber measurement
-        if not metadata.userDefinedGagesFlag and not metadata.userDefinedSegmentFlag:            
-            initPos = 0
-            posVector = np.linspace(initPos,metadata.gagePitch*newData['number of gages'],num=newData['number of gages'])
-            self.position = [ round(elem, 2) for elem in posVector ]      
-
-        # 2. N-points measurement (no segments)
-        elif metadata.userDefinedGagesFlag and not metadata.userDefinedSegmentFlag:            
-            self.position = metadata.userDefinedGagesLocs
-            self.posNames = metadata.userDefinedGagesNames
-
-        # 3. N-points, M-segments
-        elif metadata.userDefinedGagesFlag and metadata.userDefinedSegmentFlag:            
-            temporalPos = [ round(elem, 2) for elem in metadata.userDefinedGagesLocs ]                        
-            temporalNames = metadata.userDefinedGagesNames
-            for i in range(len(metadata.userDefinedSegmentLocs)):
-                temporalSegmentArray = np.linspace(metadata.userDefinedSegmentLocs[i],metadata.userDefinedSegmentLocs[i]+metadata.gagePitch*(metadata.userDefinedSegmentSize[i]-1),num=metadata.userDefinedSegmentSize[i])
-                for j in range(metadata.userDefinedSegmentSize[i]):                    
-                    temporalPos.append(round(float(temporalSegmentArray[j]),2))
-                    temporalNames.append(metadata.userDefinedSegmentNames[i]+'['+str(j)+']')                
-            
-            self.position = temporalPos
-            self.posNames = temporalNames
-
+        # The positions and names are computed once per metadata configuration (checksum) and shared
+        # (read-only) by every cycle with the same configuration, see metadataHandler.getPositions
+        self.position, self.posNames = metadata.getPositions(newData['number of gages'])
 
     def processMeasurement(self,newData,metadata):
         """ Function that handles the received measurement packages
@@ -73,37 +192,96 @@ class measurementHandler:
             return
         
         # Check if a sequence has been lost using the sequence number value
-        try:
-            self.checkSequenceNumber(newData['sequence number'])
-        except:
-            raise Exception('Sequence number error!')
+        # (the gap is recorded, and the package is stored anyway)
+        missing = self.checkSequenceNumber(newData['sequence number'])
         
         # Get number of gages and pre-allocate memory for data (only once)
         if self.gagesNumber == 0:
             self.gagesNumber = newData['number of gages']
-            self.bufferSize = 1000
-            self.measurement = np.zeros((1,self.gagesNumber))
-            self.buffer = np.zeros(((self.bufferSize, self.gagesNumber)))
-
-        # Position vector (should only be calculated once per measurement cycle)
-        if len(self.position) == 0:
+            self.metadataInfo = metadata.getInfo()
+            # Position vector (only calculated once per measurement cycle)
             self.setPositionArray(newData,metadata)
+            rowSize = self.gagesNumber
+            storedRate = metadata.measurementRate
+            if self.processing is not None:
+                # Only the region of interest is stored (with its positions and names)
+                try:
+                    self.position, self.posNames = self.processing.configure(self.position, self.posNames)
+                except Exception:
+                    # Nothing is allocated: the cycle is not left half configured
+                    self.gagesNumber = 0
+                    raise
+                rowSize = self.processing.gagesNumber
+                storedRate = storedRate * self.processing.rowsPerBlock() / self.processing.decimation
+            ringSize = 0
+            if self.writer is not None:
+                # A single block is reused, it is written to disk every time it is full
+                ringSize = self.bufferSize
+            elif self.keepSeconds > 0:
+                ringSize = max(1, math.ceil(self.keepSeconds * storedRate))
+            self.store = sampleStore(rowSize, blockSize=self.bufferSize, ringSize=ringSize)
+            self.timeStore = sampleStore((), np.int64, blockSize=self.bufferSize, ringSize=ringSize)
+            if self.sharedRing is not None:
+                self.sharedRing.allocate(rowSize, self.position)
+            for listener in self.listeners:
+                listener.start(self.position, self.posNames)
+            if instrumentation.recorder is not None:
+                # Rows stored in the current block (of the last allocated store)
+                instrumentation.recorder.addGauge('store block fill', lambda store=self.store: store.blockIndex / store.blockSize)
         
-        # Time vector (append the time stamp from newData)
-        # Maybe the same memory treatment should be applied for this vector
-        # With date:
-        #timeStampStr = str(newData['day']) + '/' + str(newData['month']) + '/' + str(newData['year']) + ' ' + str(newData['hours']) + ':' + str(newData['minutes']) + ':' + str(newData['seconds']) + '.' + str(newData['milliseconds']).zfill(3)  + str(newData['microseconds']).zfill(3)           
-        # No date:
-        timeStampStr = str(newData['hours']) + ':' + str(newData['minutes']) + ':' + str(newData['seconds']) + '.' + str(newData['milliseconds']).zfill(3) + str(newData['microseconds']).zfill(3)    
-        self.time.append(timeStampStr)  
-
-        # Add new data to buffer
-        self.buffer[self.bufferIndex] = newData['data']
-        self.bufferIndex += 1
-
-        # If buffer is full, append to self.measurement. 
-        # This is to avoid re-allocating memory every time a new measurement is received. 
-        # When 1000 measurements are received, the buffer will be emptied.        
-        if self.bufferIndex == self.bufferSize:
-            self.measurement = np.vstack((self.measurement, self.buffer))
-            self.bufferIndex = 0
\ No newline at end of file
+        # Packages with another number of gages are discarded before storing anything (a partial row would
+        # stay in the cycle, and in the stream, with a valid timestamp)
+        if len(newData['data']) != self.gagesNumber:
+            raise Exception('The package has %d values instead of %d!' % (len(newData['data']), self.gagesNumber))
+
+        # Time vector (numeric timestamp, it is only formatted when exporting)
+        timestamp = self.getTimestamp(newData)
+
+        # NaN rows for the lost packages (with the nominal period between timestamps)
+        if missing > 0 and self.fillGaps and self.lastTimestamp is not None:
+            fillRows = min(missing, self.maxFill)
+            period = (timestamp - self.lastTimestamp) / (missing + 1)
+            for i in range(1, fillRows + 1):
+                self.processRow(np.nan, self.lastTimestamp + int(round(i * period)))
+            self.filledRows += fillRows
+
+        self.processRow(newData['data'], timestamp)
+        self.lastTimestamp = timestamp
+
+    def processRow(self,data,timestamp):
+        """ Function that stores a sample, through the processing stage (if there is one)
+        """
+        if self.processing is None:
+            self.storeRow(data, timestamp)
+            return
+        for row, rowTimestamp in self.processing.process(data, timestamp):
+            self.storeRow(row, rowTimestamp)
+
+    def flushBlock(self):
+        """ Function that writes the rows of the current block to disk (the info is saved with the first block,
+        so an interrupted stream can still be interpreted)
+        """
+        info = self.getInfo() if self.writer.rowCount == 0 else None
+        self.writer.writeBlock(self.store.lastBlock(), self.timeStore.lastBlock(), info)
+
+    def storeRow(self,data,timestamp):
+        """ Function that stores a row (and its timestamp), writing the block to disk if it is full (with a writer)
+        """
+        self.timeStore.append(timestamp)
+
+        # Add new data to the store
+        # The rows are written into preallocated blocks, which are only concatenated at the end of the cycle
+        # (so the previously stored data is never copied while measuring)
+        row = self.store.nextRow()
+        row[:] = data
+        if self.sharedRing is not None:
+            self.sharedRing.writeRow(row, timestamp, self.sequenceNumber)
+        for listener in self.listeners:
+            listener.processRow(row, timestamp)
+
+        if self.writer is not None and self.store.blockIndex == self.store.blockSize:
+            recorder = instrumentation.recorder
+            startTime = time.perf_counter_ns() if recorder is not None else 0
+            self.flushBlock()
+            if recorder is not None:
+                recorder.observe('flush', time.perf_counter_ns() - startTime)
\ No newline at end of file
@@ -1,8 +1,17 @@
+import numpy as np
+
 class metadataHandler:    
     """ Metadata class
+
+    The top-level parameters (gage pitch, gages, segments...) are the ones of the first sensor.
+    The parameters of every sensor (channel) are also stored in self.channels, as one metadataHandler
+    per channel (see getChannel).
     """
     def __init__(self):
         self.checkSum = '0000'      
+        self.channel = None         # Channel number of the sensor parameters stored in this object
+        self.channels = {}          # Channel number -> metadataHandler with the parameters of that sensor
+        self.positionCache = {}     # (checksum, channel, number of gages) -> (positions, names), shared with the channels
         self.status = ''
         self.sensorLength = 0
         self.sensorType = ''
@@ -53,9 +62,90 @@ class metadataHandler:
         self.checkSum = '0000'
         return
         
-    def getGages(self,newData):
+    def getInfo(self):
+        """ Function that returns the main metadata parameters as a dictionary (e.g. to be saved with the data).
+        """
+        return {'checksum': self.checkSum,
+                'channel': self.channel,
+                'measurement rate': self.measurementRate,
+                'gage pitch (mm)': self.gagePitch,
+                'length (m)': self.sensorLength,
+                'sensor type': self.sensorType}
+
+    def getChannel(self,channel):
+        """ Function that returns the metadata of a channel (the first sensor if the channel is unknown or None).
+        """
+        return self.channels.get(channel, self)
+
+    def updateSensor(self,newData,sensorIndex=0):
+        """ Function that updates the sensor parameters (pitch, length, type, gages and segments) from one of the sensors in newData.
+        """
+        sensor = newData['sensors'][sensorIndex]
+        self.gagePitch = sensor['gage pitch (mm)']
+        self.sensorLength = sensor['length (m)']
+        self.sensorType = sensor['sensor type']
+        self.measurementRate = newData['measurement rate']       
+
+        # Obtain gages:
+        self.getGages(newData, sensorIndex)
+
+    def getPositions(self,gagesNumber):
+        """ Function that returns the position vector and the gage/segment names of the measurement.
+
+        They are computed (vectorized) only once per checksum and cached, so every measurement cycle with
+        the same configuration reuses them. The returned array and tuple must not be modified.
+        Inputs:
+            gagesNumber: int
+                Number of gages of the measurement packages (used for full fiber measurements).
+        Outputs:
+            positions: np.ndarray
+                Position of every gage (mm), rounded to 2 decimals.
+            names: tuple
+                Name of every gage (empty for full fiber measurements).
+        """
+        key = (self.checkSum, self.channel, gagesNumber)
+        cached = self.positionCache.get(key)
+        if cached is not None:
+            return cached
+
+        # Check for the 3 possible cases of position vector:
+        # 1. Full fiber measurement
+        if not self.userDefinedGagesFlag and not self.userDefinedSegmentFlag:
+            positions = np.round(np.linspace(0, self.gagePitch*gagesNumber, num=gagesNumber), 2)
+            names = ()
+
+        # 2. N-points measurement (no segments)
+        elif self.userDefinedGagesFlag and not self.userDefinedSegmentFlag:
+            positions = np.asarray(self.userDefinedGagesLocs, dtype=float)
+            names = tuple(self.userDefinedGagesNames)
+
+        # 3. N-points, M-segments
+        else:
+            # Every segment point: from the segment location, with the gage pitch
+            sizes = np.asarray(self.userDefinedSegmentSize, dtype=np.int64)
+            segmentIndex = np.repeat(np.arange(len(sizes)), sizes)
+            pointIndex = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            segmentPositions = [np.linspace(location, location + self.gagePitch * (size - 1), num=size)
+                                for location, size in zip(self.userDefinedSegmentLocs, self.userDefinedSegmentSize)]
+            # Rounded with the Python round (exact decimal ties, e.g. 12.345 -> 12.35), not np.round
+            positions = np.array([round(float(position), 2) for position in
+                                  np.concatenate([np.asarray(self.userDefinedGagesLocs, dtype=float)] + segmentPositions)])
+
+            # Segment point names: 'segment name[index]'
+            segmentNames = np.char.add(np.char.add(np.asarray(self.userDefinedSegmentNames, dtype=str)[segmentIndex], '['),
+                                       np.char.add(pointIndex.astype(str), ']'))
+            names = tuple(self.userDefinedGagesNames) + tuple(segmentNames.tolist())
+
+        positions.setflags(write=False)
+        if len(self.positionCache) > 16:
+            self.positionCache.clear()
+        self.positionCache[key] = (positions, names)
+        return positions, names
+
+    def getGages(self,newData,sensorIndex=0):
         """ Function that process the newData JSON to obtain the number and information of gages.
         """
+        sensor = newData['sensors'][sensorIndex]
        
         # 3 cases:
         # - 0 gages, 0 segments: full fiber measurement
@@ -63,11 +153,11 @@ class metadataHandler:
         # - N (>0) gages, M (>0) segments: N-points measurement, plus M segments measurement, which
         # have X points each
         
-        if 'gages' not in newData['sensors'][0] and ('segments' not in newData['sensors'][0] or newData['sensors'][0]['segments'][0]['segment name'] == 'default'):    # Full measurement
+        if 'gages' not in sensor and ('segments' not in sensor or sensor['segments'][0]['segment name'] == 'default'):    # Full measurement
             self.userDefinedGagesFlag = False
             self.userDefinedSegmentFlag = False
 
-        elif 'gages' in newData['sensors'][0] and 'segments' not in newData['sensors'][0]:    # N-points measurement
+        elif 'gages' in sensor and 'segments' not in sensor:    # N-points measurement
             self.userDefinedGagesFlag = True
             self.userDefinedSegmentFlag = False
 
@@ -75,12 +165,12 @@ class metadataHandler:
             self.userDefinedGagesLocs = []
             self.userDefinedGagesIndex = []
             self.userDefinedGagesNames = []
-            for i in range(len(newData['sensors'][0]['gages'])):
-                self.userDefinedGagesLocs.append(newData['sensors'][0]['gages'][i]['location (mm)'])  
-                self.userDefinedGagesIndex.append(newData['sensors'][0]['gages'][i]['index'])  
-                self.userDefinedGagesNames.append(newData['sensors'][0]['gages'][i]['gage name'])
+            for i in range(len(sensor['gages'])):
+                self.userDefinedGagesLocs.append(sensor['gages'][i]['location (mm)'])  
+                self.userDefinedGagesIndex.append(sensor['gages'][i]['index'])  
+                self.userDefinedGagesNames.append(sensor['gages'][i]['gage name'])
 
-        elif 'gages' in newData['sensors'][0] and 'segments' in newData['sensors'][0]:    # N-points, M-segments measurement
+        elif 'gages' in sensor and 'segments' in sensor:    # N-points, M-segments measurement
             self.userDefinedGagesFlag = True
             self.userDefinedSegmentFlag = True
 
@@ -88,21 +178,21 @@ class metadataHandler:
             self.userDefinedGagesLocs = []
             self.userDefinedGagesIndex = []
             self.userDefinedGagesNames = []
-            for i in range(len(newData['sensors'][0]['gages'])):
-                self.userDefinedGagesLocs.append(newData['sensors'][0]['gages'][i]['location (mm)'])  
-                self.userDefinedGagesIndex.append(newData['sensors'][0]['gages'][i]['index'])  
-                self.userDefinedGagesNames.append(newData['sensors'][0]['gages'][i]['gage name'])
+            for i in range(len(sensor['gages'])):
+                self.userDefinedGagesLocs.append(sensor['gages'][i]['location (mm)'])  
+                self.userDefinedGagesIndex.append(sensor['gages'][i]['index'])  
+                self.userDefinedGagesNames.append(sensor['gages'][i]['gage name'])
 
             # Get segments
             self.userDefinedSegmentLocs = []            
             self.userDefinedSegmentIndex = []
             self.userDefinedSegmentNames = []
             self.userDefinedSegmentSize = []
-            for i in range(len(newData['sensors'][0]['segments'])):                                       
-                self.userDefinedSegmentLocs.append(newData['sensors'][0]['segments'][i]['location (mm)'])
-                self.userDefinedSegmentIndex.append(newData['sensors'][0]['segments'][i]['index'])
-                self.userDefinedSegmentNames.append(newData['sensors'][0]['segments'][i]['segment name'])
-                self.userDefinedSegmentSize.append(newData['sensors'][0]['segments'][i]['size'])       
+            for i in range(len(sensor['segments'])):                                       
+                self.userDefinedSegmentLocs.append(sensor['segments'][i]['location (mm)'])
+                self.userDefinedSegmentIndex.append(sensor['segments'][i]['index'])
+                self.userDefinedSegmentNames.append(sensor['segments'][i]['segment name'])
+                self.userDefinedSegmentSize.append(sensor['segments'][i]['size'])       
                 
     def processMetadata(self,newChecksum,newData,measuringFlag):    
         """ Function that handles the received metadata packages        
@@ -113,6 +203,8 @@ class metadataHandler:
 
         # Update and check system status: 
         self.updateStatus(newData)        
+        for channelObj in self.channels.values():
+            channelObj.status = self.status
         if self.checkStatus() == 'init':
             print('Connection stablished with server!')
             print('Acquiring metadata, please wait before measuring (the Odisi should be in "Arm" mode)...')
@@ -125,13 +217,19 @@ class metadataHandler:
         if self.checksumChanged(newChecksum) and not measuringFlag:
             # Update metadata parameters:
             self.checkSum = newChecksum     
-            self.gagePitch = newData['sensors'][0]['gage pitch (mm)']
-            self.sensorLength = newData['sensors'][0]['length (m)']
-            self.sensorType = newData['sensors'][0]['sensor type']
-            self.measurementRate = newData['measurement rate']       
-            
-            # Obtain gages:
-            self.getGages(newData)
+            self.updateSensor(newData)
+
+            # Parameters of every channel (sensors without a channel number are numbered in order):
+            self.channels = {}
+            for i in range(len(newData['sensors'])):
+                channelObj = metadataHandler()
+                channelObj.channel = newData['sensors'][i].get('channel', i + 1)
+                channelObj.positionCache = self.positionCache
+                channelObj.checkSum = newChecksum
+                channelObj.status = self.status
+                channelObj.updateSensor(newData, i)
+                self.channels[channelObj.channel] = channelObj
+            self.channel = None if not self.channels else next(iter(self.channels))
 
             print('Metadata updated!')            
             return
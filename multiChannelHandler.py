@@ -0,0 +1,72 @@
+from measurementHandler import measurementHandler
+
+class multiChannelHandler:
+    """ Multi-channel measurement class
+
+    The measurement packages are stored per channel (using the 'channel' field of the package), each one
+    in its own measurementHandler, with its own preallocated arrays, position vector and metadata
+    (metadataHandler.getChannel). It can be used wherever a measurementHandler is used: the measurement,
+    time, position and posNames attributes are the ones of the first channel.
+    """
+    def __init__(self, channelFactory=None):
+        # Function that receives the channel number and returns a new measurementHandler
+        self.channelFactory = channelFactory if channelFactory is not None else (lambda channel: measurementHandler())
+        self.channels = {}      # Channel number -> measurementHandler
+
+    def getChannelHandler(self,channel):
+        """ Function that returns the measurementHandler of a channel (it is created with the first package of the channel).
+        """
+        channelObj = self.channels.get(channel)
+        if channelObj is None:
+            channelObj = self.channelFactory(channel)
+            self.channels[channel] = channelObj
+        return channelObj
+
+    def processMeasurement(self,newData,metadata):
+        """ Function that handles the received measurement packages (each one is stored in its channel)
+        """
+        channel = newData.get('channel')
+        self.getChannelHandler(channel).processMeasurement(newData, metadata.getChannel(channel))
+
+    def emptyBuffer(self):
+        """ Function that finishes the cycle of every channel
+        """
+        for channelObj in self.channels.values():
+            channelObj.emptyBuffer()
+
+    def getSampleCount(self):
+        """ Function that returns the number of received samples (of all the channels) in the cycle.
+        """
+        return sum(channelObj.getSampleCount() for channelObj in self.channels.values())
+
+    def getCycle(self):
+        """ Function that returns the measurement cycle of the first channel (see measurementHandler.getCycle).
+        """
+        return self.firstChannel().getCycle()
+
+    def firstChannel(self):
+        """ Function that returns the measurementHandler of the first channel (an empty one if nothing was received).
+        """
+        if not self.channels:
+            return measurementHandler()
+        return next(iter(self.channels.values()))
+
+    @property
+    def measurement(self):
+        return self.firstChannel().measurement
+
+    @property
+    def time(self):
+        return self.firstChannel().time
+
+    @property
+    def position(self):
+        return self.firstChannel().position
+
+    @property
+    def posNames(self):
+        return self.firstChannel().posNames
+
+    @property
+    def lostPackages(self):
+        return sum(channelObj.lostPackages for channelObj in self.channels.values())
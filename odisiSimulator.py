@@ -0,0 +1,221 @@
+""" Tools to generate synthetic Odisi datastreams and to serve them locally (used for benchmarking
+and testing without the equipment).
+"""
+
+import time
+import asyncio
+import json
+import zlib
+import datetime
+import numpy as np
+import streamCapture
+
+def framePackage(packageJSON):
+    """ Function that serializes a package as the Odisi sends it: JSON text, checksum line and '\\x00' terminator.
+    """
+    body = json.dumps(packageJSON, separators=(',', ':')).encode('utf-8')
+    checksum = '%08X' % zlib.crc32(body)
+    return body + b'\r\n' + checksum.encode('utf-8') + b'\x00'
+
+def buildMetadataPackage(status, gagePitch=0.65, sensorLength=10.0, measurementRate=100, sensors=None):
+    """ Function that builds a metadata package.
+    Inputs:
+        status: str
+            System status ('', 'stopped' or 'measuring').
+        sensors: list
+            List of sensor dictionaries. By default, a single full fiber sensor is used.
+    """
+    if sensors is None:
+        sensors = [{'channel': 1, 'gage pitch (mm)': gagePitch, 'length (m)': sensorLength, 'sensor type': 'Strain'}]
+    return {'message type': 'metadata', 'system status': status, 'measurement rate': measurementRate, 'sensors': sensors}
+
+def buildMeasurementPackage(sequenceNumber, data, timeStamp=0.0, channel=1):
+    """ Function that builds a measurement package.
+    Inputs:
+        sequenceNumber: int
+            Sequence number of the package.
+        data: list or np.ndarray
+            Measured value of every gage.
+        timeStamp: float
+            Time of the measurement in seconds since the epoch.
+    """
+    timeStruct = datetime.datetime.fromtimestamp(timeStamp, datetime.timezone.utc)
+    microTotal = timeStruct.microsecond
+    return {'message type': 'measurement', 'sequence number': sequenceNumber, 'channel': channel,
+            'year': timeStruct.year, 'month': timeStruct.month, 'day': timeStruct.day,
+            'hours': timeStruct.hour, 'minutes': timeStruct.minute, 'seconds': timeStruct.second,
+            'milliseconds': microTotal // 1000, 'microseconds': microTotal % 1000,
+            'number of gages': len(data), 'data': [round(float(value), 3) for value in data]}
+
+def measurementPackageBytes(sequenceNumber, dataText, gagesNumber, timeStamp=0.0, channel=1):
+    """ Function that builds a framed measurement package from the already serialized data array.
+
+    It is much faster than framePackage(buildMeasurementPackage(...)) for large packages, because the
+    data values are not serialized again for every package (used by serveSynthetic).
+    Inputs:
+        dataText: bytes
+            Comma separated values of the data array (without brackets).
+    """
+    header = buildMeasurementPackage(sequenceNumber, [], timeStamp, channel)
+    header['number of gages'] = gagesNumber
+    headerText = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    body = headerText[:-3] + b'[' + dataText + b']}'
+    checksum = '%08X' % zlib.crc32(body)
+    return body + b'\r\n' + checksum.encode('utf-8') + b'\x00'
+
+def syntheticCycle(nSamples, nGages, measurementRate=100, startTime=1700000000.0, seed=0, channelsNumber=1):
+    """ Function that builds the byte stream of a complete measurement cycle.
+
+    The stream contains a welcome message, a 'stopped' metadata package, nSamples measurement packages
+    (per channel) and a final 'stopped' metadata package (as sent by the Odisi when the measurement ends).
+    """
+    rng = np.random.default_rng(seed)
+    sensors = [{'channel': channel + 1, 'gage pitch (mm)': 0.65, 'length (m)': 10.0, 'sensor type': 'Strain'}
+               for channel in range(channelsNumber)]
+    stream = [framePackage(buildMetadataPackage('', measurementRate=measurementRate, sensors=sensors)),
+              framePackage(buildMetadataPackage('stopped', measurementRate=measurementRate, sensors=sensors))]
+    for i in range(nSamples):
+        for channel in range(channelsNumber):
+            data = rng.normal(0.0, 50.0, nGages)
+            stream.append(framePackage(buildMeasurementPackage(i + 1, data, startTime + i / measurementRate, channel + 1)))
+    stream.append(framePackage(buildMetadataPackage('stopped', measurementRate=measurementRate, sensors=sensors)))
+    return b''.join(stream)
+
+def splitStream(stream, segmentSize):
+    """ Function that splits a byte stream in TCP-like segments of a fixed size.
+    """
+    return [stream[i:i + segmentSize] for i in range(0, len(stream), segmentSize)]
+
+def loadRecording(filename):
+    """ Function that loads a recorded Odisi datastream (raw bytes or capture file, see streamCapture).
+    """
+    if streamCapture.isCapture(filename):
+        return b''.join(data for _, data in streamCapture.readCapture(filename))
+    with open(filename, 'rb') as recordingFile:
+        return recordingFile.read()
+
+class segmentSocket:
+    """ Socket stand-in that returns a stream in fixed-size segments (one per recv/recv_into call).
+
+    It is used to test the client with adversarial fragmentation (e.g. 1-byte segments, or many
+    packages per segment) without the TCP stack merging or splitting the segments.
+    """
+    def __init__(self, stream, segmentSize):
+        self.stream = memoryview(stream)
+        self.segmentSize = segmentSize
+        self.offset = 0
+
+    def recv_into(self, buffer, nBytes=0):
+        nBytes = min(nBytes or len(buffer), self.segmentSize, len(self.stream) - self.offset)
+        buffer[:nBytes] = self.stream[self.offset:self.offset + nBytes]
+        self.offset += nBytes
+        return nBytes
+
+    def recv(self, bufferSize):
+        nBytes = min(bufferSize, self.segmentSize, len(self.stream) - self.offset)
+        data = bytes(self.stream[self.offset:self.offset + nBytes])
+        self.offset += nBytes
+        return data
+
+async def serveReplay(stream, host='127.0.0.1', port=0, segmentSize=4096, segmentDelay=0.0, keepOpen=False):
+    """ Function that starts a local asyncio server that stands in for the Odisi.
+
+    Every client that connects receives the whole stream (e.g. syntheticCycle() or loadRecording()),
+    in segments of segmentSize bytes. Afterwards the connection is closed, unless keepOpen is True.
+    Outputs:
+        server: asyncio.Server
+            Running server (the port is in server.sockets[0].getsockname()[1]).
+    """
+    async def handleClient(reader, writer):
+        try:
+            for segment in splitStream(stream, segmentSize):
+                writer.write(segment)
+                await writer.drain()
+                if segmentDelay > 0:
+                    await asyncio.sleep(segmentDelay)
+            if keepOpen:
+                await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handleClient, host, port)
+
+async def serveCapture(filename, host='127.0.0.1', port=0, speed=1.0):
+    """ Function that starts a local server that replays a capture file (see streamCapture) to every client.
+
+    The messages are sent with their original timing, scaled by speed (speed <= 0: as fast as possible).
+    """
+    records = list(streamCapture.readCapture(filename))
+
+    async def handleClient(reader, writer):
+        startTime = time.perf_counter()
+        try:
+            for timestamp, data in records:
+                if speed > 0:
+                    delay = timestamp / speed - (time.perf_counter() - startTime)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handleClient, host, port)
+
+async def serveSynthetic(measurementRate, gagesNumber, duration, host='127.0.0.1', port=0, channelsNumber=1,
+                         maxBuffer=4194304, stats=None, seed=0):
+    """ Function that starts a local server that behaves like the Odisi while measuring.
+
+    Every client receives the welcome and 'stopped' metadata packages, then measurement packages at
+    measurementRate (Hz, per channel) during duration seconds, and a final 'stopped' metadata package.
+    Like the Odisi, the server does not wait for a slow client: if more than maxBuffer bytes are waiting
+    to be sent, the new packages are dropped (so the client sees lost sequence numbers).
+    Inputs:
+        stats: dict
+            If given, it is updated with the number of 'sent' and 'dropped' packages.
+    """
+    rng = np.random.default_rng(seed)
+    # A few different data arrays are serialized once and reused
+    dataTexts = [','.join('%.3f' % value for value in rng.normal(0.0, 50.0, gagesNumber)).encode('utf-8') for _ in range(8)]
+    sensors = [{'channel': channel + 1, 'gage pitch (mm)': 0.65, 'length (m)': 10.0, 'sensor type': 'Strain'}
+               for channel in range(channelsNumber)]
+    if stats is None:
+        stats = {}
+    stats.update({'sent': 0, 'dropped': 0})
+
+    async def handleClient(reader, writer):
+        try:
+            writer.write(framePackage(buildMetadataPackage('', measurementRate=measurementRate, sensors=sensors)))
+            writer.write(framePackage(buildMetadataPackage('stopped', measurementRate=measurementRate, sensors=sensors)))
+            await writer.drain()
+
+            nSamples = int(round(duration * measurementRate))
+            startTime = time.perf_counter()
+            sample = 0
+            while sample < nSamples:
+                # Send all the samples that are due (several per iteration at high rates)
+                dueSamples = min(nSamples, int((time.perf_counter() - startTime) * measurementRate) + 1)
+                while sample < dueSamples:
+                    timeStamp = time.time()
+                    for channel in range(channelsNumber):
+                        if writer.transport.get_write_buffer_size() > maxBuffer:
+                            stats['dropped'] += 1
+                            continue
+                        writer.write(measurementPackageBytes(sample + 1, dataTexts[sample % len(dataTexts)], gagesNumber, timeStamp, channel + 1))
+                        stats['sent'] += 1
+                    sample += 1
+                await asyncio.sleep(max(0.0, startTime + sample / measurementRate - time.perf_counter()))
+
+            writer.write(framePackage(buildMetadataPackage('stopped', measurementRate=measurementRate, sensors=sensors)))
+            await writer.drain()
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handleClient, host, port)
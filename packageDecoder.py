@@ -0,0 +1,65 @@
+""" Functions to decode the packages received from Odisi.
+
+Measurement packages are decoded with a dedicated path: only the (small) header is parsed with json,
+while the 'data' array is parsed directly into a NumPy array, avoiding one Python float object per gage.
+Metadata (and any other) packages are decoded with json.loads.
+The payload is searched and sliced without copying it: only the header and the data text are copied once.
+"""
+
+import re
+import json
+import numpy as np
+
+DATA_KEY = re.compile(rb'"data"')
+OPEN_BRACKET = re.compile(rb'\[')
+CLOSE_BRACKET = re.compile(rb'\]')
+
+def decodePackage(payload):
+    """ Function that decodes the JSON text of a package.
+    Inputs:
+        payload: bytes, bytearray or memoryview
+            JSON text of the package (as returned by packageFramer).
+    Outputs:
+        packageJSON: dict
+            Decoded package. For measurement packages, packageJSON['data'] is a float64 np.ndarray.
+    """
+    # Locate the data array: '"data": [ ... ]' (the regular expressions search the buffer without copying it)
+    match = DATA_KEY.search(payload)
+    match = OPEN_BRACKET.search(payload, match.end()) if match is not None else None
+    openBracket = match.start() if match is not None else -1
+    match = CLOSE_BRACKET.search(payload, openBracket) if match is not None else None
+    if match is None:
+        return json.loads(bytes(payload))
+    closeBracket = match.start()
+
+    # Parse the header (everything but the content of the data array)
+    view = memoryview(payload)
+    packageJSON = json.loads(b''.join((view[:openBracket + 1], view[closeBracket:])))
+    if packageJSON.get('message type') != 'measurement':
+        return json.loads(bytes(payload))
+
+    # np.fromstring needs a bytes object: the data text is copied once
+    packageJSON['data'] = decodeDataArray(bytes(view[openBracket + 1:closeBracket]), packageJSON.get('number of gages'))
+    return packageJSON
+
+def decodeDataArray(dataText, gagesNumber=None):
+    """ Function that parses the content of the 'data' array (comma separated numbers, without brackets).
+    Inputs:
+        dataText: bytes
+            Text between the brackets of the data array.
+        gagesNumber: int
+            Expected number of values (None to skip the check).
+    Outputs:
+        data: np.ndarray
+            Parsed values (float64).
+    """
+    if not dataText.strip():
+        return np.zeros(0)
+    try:
+        data = np.fromstring(dataText, sep=',')
+    except ValueError:
+        data = None
+    if data is None or (gagesNumber is not None and len(data) != gagesNumber):
+        # Unexpected content (e.g. null values), use the generic parser
+        data = np.array(json.loads(b'[' + dataText + b']'), dtype=float)
+    return data
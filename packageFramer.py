@@ -0,0 +1,124 @@
+class packageFramer:
+    """ Incremental framer for the Odisi TCP datastream.
+
+    Received bytes are written straight into a growable bytearray (with recv_into) and the
+    '\\x00' terminators are searched only in the bytes that have not been scanned yet, so
+    large packages arriving across many TCP messages are not copied again on every recv.
+    Each complete package is returned as a (payload, checksum) pair, where payload is a
+    memoryview over the JSON text of the package (no copy).
+
+    Note: the payload views are only valid until the next call to recvInto() or feed(),
+    because the buffer is compacted in place when new data arrives.
+    """
+    def __init__(self, chunkSize=65536, initialSize=262144):
+        self.chunkSize = chunkSize          # Minimum free space requested for every recv_into call
+        self.buffer = bytearray(max(initialSize, chunkSize))
+        self.view = memoryview(self.buffer)
+        self.start = 0                      # First byte not yet returned as part of a package
+        self.end = 0                        # End of the valid data in the buffer
+        self.scanOffset = 0                 # Bytes before this offset are known to contain no terminator
+
+    def pendingBytes(self):
+        """ Function that returns the number of received bytes not yet returned as a package.
+        """
+        return self.end - self.start
+
+    def reset(self):
+        """ Function that discards all the stored data.
+        """
+        self.start = 0
+        self.end = 0
+        self.scanOffset = 0
+
+    def reserve(self, size):
+        """ Function that makes sure there are at least 'size' free bytes at the end of the buffer.
+
+        The pending data is first moved to the beginning of the buffer. Only if that is not
+        enough, a new buffer (twice as large) is allocated. Any view returned before is invalidated.
+        """
+        if self.start == self.end:
+            self.reset()
+        if len(self.buffer) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+        if pending + size <= len(self.buffer):
+            # Compact: move the incomplete package to the beginning of the buffer
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            # Grow: a new buffer is allocated (instead of resizing in place) so this also works
+            # while a caller still holds a view over the old buffer
+            newSize = len(self.buffer)
+            while pending + size > newSize:
+                newSize *= 2
+            newBuffer = bytearray(newSize)
+            newBuffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            self.buffer = newBuffer
+            self.view = memoryview(self.buffer)
+
+        self.scanOffset -= self.start
+        self.start = 0
+        self.end = pending
+
+    def recvInto(self, connectedSocket):
+        """ Function that receives data from the socket directly into the framer buffer.
+        Outputs:
+            nBytes: int
+                Number of received bytes (0 means the connection was closed).
+        """
+        self.reserve(self.chunkSize)
+        nBytes = connectedSocket.recv_into(self.view[self.end:])
+        self.end += nBytes
+        return nBytes
+
+    def feed(self, data):
+        """ Function to append already received data (bytes, bytearray or memoryview) to the buffer.
+        """
+        nBytes = len(data)
+        self.reserve(nBytes)
+        self.view[self.end:self.end + nBytes] = data
+        self.end += nBytes
+        return nBytes
+
+    def packages(self):
+        """ Generator that yields every complete package stored in the buffer.
+        Outputs:
+            payload: memoryview
+                JSON text of the package (without the checksum line).
+            checksum: str
+                Checksum of the package (None if the package has no checksum line).
+        """
+        # Same parsing principles as parseReceivedData:
+        # Each package ends with a '\x00' terminator and contains the JSON text and, in the last line, the checksum
+        # Anything that does not start with '{' is not a package and it is discarded
+        while True:
+            terminator = self.buffer.find(b'\x00', self.scanOffset, self.end)
+            if terminator == -1:
+                self.scanOffset = self.end
+                if self.start < self.end and self.buffer[self.start] != 0x7B:   # b'{'
+                    # Not the beginning of a package, discard it
+                    self.reset()
+                return
+
+            packageStart = self.start
+            self.start = terminator + 1
+            self.scanOffset = self.start
+            if self.buffer[packageStart] != 0x7B:   # b'{'
+                continue
+
+            # The checksum is in the last line of the package (ignore trailing line breaks)
+            lineEnd = terminator
+            while lineEnd > packageStart and self.buffer[lineEnd - 1] in (0x0A, 0x0D):
+                lineEnd -= 1
+            newLine = self.buffer.rfind(b'\n', packageStart, lineEnd)
+            if newLine == -1:
+                checksum = None
+                payloadEnd = lineEnd
+            else:
+                checksum = self.buffer[newLine + 1:lineEnd].decode('utf-8').strip()
+                payloadEnd = newLine
+                if payloadEnd > packageStart and self.buffer[payloadEnd - 1] == 0x0D:    # b'\r'
+                    payloadEnd -= 1
+
+            yield self.view[packageStart:payloadEnd], checksum
@@ -0,0 +1,161 @@
+import numpy as np
+
+class regionOfInterestError(Exception):
+    """ Error of the region of interest (invalid, or it does not contain any gage of the measurement).
+    It is not a problem of a single package, so it stops the acquisition (see OdisiTCPClient.processPackage).
+    """
+
+class processingStage:
+    """ Processing stage class (between the decoded packages and the measurementHandler storage)
+
+    Region of interest: only the gages inside positionRanges (mm, list of (start, end)) or with the given
+    names are kept. A segment name selects every point of the segment ('A' selects 'A[0]', 'A[1]'...).
+    With neither of them, every gage is kept.
+    Decimation: every decimation samples are reduced to
+        - 'mean': one row with the mean of the block (and the mean timestamp).
+        - 'minmax': two rows, the minimum (first timestamp) and the maximum (last timestamp) of the block,
+          so the envelope of the signal is kept.
+    NaN values (e.g. the rows inserted for lost packages) are ignored: a gage is only NaN in the decimated row
+    if it is NaN in every sample of the block.
+    The stage keeps the state of the current block, so every measurementHandler needs its own stage.
+    """
+    def __init__(self, positionRanges=None, names=None, decimation=1, mode='mean'):
+        if mode not in ('mean', 'minmax'):
+            raise Exception('Unknown decimation mode %s!' % mode)
+        if decimation < 1:
+            raise Exception('The decimation must be at least 1!')
+        self.positionRanges = [tuple(positionRange) for positionRange in positionRanges] if positionRanges else []
+        self.names = list(names) if names else []
+        for positionRange in self.positionRanges:
+            if len(positionRange) != 2 or not np.all(np.isfinite(np.asarray(positionRange, dtype=float))):
+                raise regionOfInterestError('Invalid position range %s!' % (positionRange,))
+        for name in self.names:
+            if not isinstance(name, str) or not name:
+                raise regionOfInterestError('Invalid gage name %r!' % (name,))
+        self.decimation = int(decimation)
+        self.mode = mode
+
+        self.index = slice(None)    # Selected gages (a slice if they are contiguous, so no copy is made)
+        self.gagesNumber = 0        # Number of selected gages
+        self.blockCount = 0         # Samples in the current decimation block
+        self.blockSum = None
+        self.blockFinite = None     # Finite values of every gage in the current block
+        self.blockMin = None
+        self.blockMax = None
+        self.timeSum = 0
+        self.firstTimestamp = 0
+        self.lastTimestamp = 0
+
+    def isPassthrough(self):
+        """ Function that checks if the stage does nothing (every gage, no decimation).
+        """
+        return not self.positionRanges and not self.names and self.decimation == 1
+
+    def rowsPerBlock(self):
+        """ Function that returns the number of output rows per decimation block.
+        """
+        return 2 if self.mode == 'minmax' and self.decimation > 1 else 1
+
+    def configure(self, position, posNames):
+        """ Function that selects the gages of the region of interest (once per cycle) and resets the decimation.
+        Inputs:
+            position: np.ndarray
+                Position vector (see measurementHandler.setPositionArray).
+            posNames: tuple
+                Gage/segment names (empty for full fiber measurements).
+        Outputs:
+            position: np.ndarray
+                Position of the selected gages.
+            posNames: tuple
+                Names of the selected gages.
+        """
+        position = np.asarray(position, dtype=float)
+        if self.positionRanges or self.names:
+            selected = np.zeros(len(position), dtype=bool)
+            for start, end in self.positionRanges:
+                selected |= (position >= min(start, end)) & (position <= max(start, end))
+            if self.names and len(posNames):
+                nameArray = np.asarray(posNames, dtype=str)
+                # Segment points are named 'segment[index]'
+                baseNames = np.asarray([name.split('[', 1)[0] for name in posNames], dtype=str)
+                selected |= np.isin(nameArray, self.names) | np.isin(baseNames, self.names)
+            selectedIndex = np.flatnonzero(selected)
+            if len(selectedIndex) == 0:
+                if not self.positionRanges and not len(posNames):
+                    raise regionOfInterestError('The region of interest does not contain any gage (the measurement has no gage names)!')
+                raise regionOfInterestError('The region of interest does not contain any gage (positions from %.2f to %.2f mm)!'
+                                            % (position.min(), position.max()))
+            if selectedIndex[-1] - selectedIndex[0] + 1 == len(selectedIndex):
+                self.index = slice(int(selectedIndex[0]), int(selectedIndex[-1]) + 1)
+            else:
+                self.index = selectedIndex
+        else:
+            self.index = slice(None)
+
+        position = position[self.index]
+        if len(posNames):
+            posNames = tuple(np.asarray(posNames, dtype=object)[self.index].tolist())
+        self.gagesNumber = len(position)
+        self.blockCount = 0
+        self.blockSum = np.zeros(self.gagesNumber)
+        self.blockFinite = np.zeros(self.gagesNumber, dtype=np.int64)
+        self.blockMin = np.empty(self.gagesNumber)
+        self.blockMax = np.empty(self.gagesNumber)
+        return position, posNames
+
+    def process(self, data, timestamp):
+        """ Function that processes a sample.
+        Outputs:
+            rows: list
+                (row, timestamp) to store (empty until a decimation block is complete).
+        """
+        if np.isscalar(data):
+            # NaN row of a lost package
+            row = np.full(self.gagesNumber, data, dtype=float)
+        else:
+            row = np.asarray(data, dtype=float)[self.index]
+        if self.decimation == 1:
+            return [(row, timestamp)]
+
+        if self.blockCount == 0:
+            self.firstTimestamp = timestamp
+            self.timeSum = 0
+            self.blockSum[:] = 0.0
+            self.blockFinite[:] = 0
+            self.blockMin[:] = np.nan
+            self.blockMax[:] = np.nan
+        if self.mode == 'mean':
+            finite = np.isfinite(row)
+            np.add(self.blockSum, row, out=self.blockSum, where=finite)
+            self.blockFinite += finite
+        else:
+            # fmin/fmax ignore the NaN values
+            np.fmin(self.blockMin, row, out=self.blockMin)
+            np.fmax(self.blockMax, row, out=self.blockMax)
+        self.timeSum += timestamp - self.firstTimestamp
+        self.lastTimestamp = timestamp
+        self.blockCount += 1
+
+        if self.blockCount == self.decimation:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """ Function that returns the rows of the current (possibly incomplete) decimation block.
+        """
+        if self.decimation == 1 or self.blockCount == 0:
+            return []
+        blockCount = self.blockCount
+        self.blockCount = 0
+        if self.mode == 'mean':
+            mean = np.full(self.gagesNumber, np.nan)
+            np.divide(self.blockSum, self.blockFinite, out=mean, where=self.blockFinite > 0)
+            return [(mean, self.firstTimestamp + self.timeSum // blockCount)]
+        return [(self.blockMin.copy(), self.firstTimestamp), (self.blockMax.copy(), self.lastTimestamp)]
+
+    def getInfo(self):
+        """ Function that returns the processing parameters (to be saved with the data).
+        """
+        return {'position ranges (mm)': [list(positionRange) for positionRange in self.positionRanges],
+                'names': self.names, 'decimation': self.decimation, 'mode': self.mode,
+                'selected gages': self.gagesNumber}
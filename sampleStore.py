@@ -0,0 +1,76 @@
+import numpy as np
+
+class sampleStore:
+    """ Sample storage class
+
+    Rows are written into fixed-size NumPy blocks. When a block is full, a new one is allocated
+    (the stored rows are never copied), and all the blocks are concatenated only once, when the
+    complete array is requested with toArray().
+    With ringSize > 0, the store keeps only the last ringSize rows in a single preallocated array
+    (bounded memory, e.g. to keep the last N seconds while monitoring).
+    """
+    def __init__(self, rowShape=(), dtype=np.float64, blockSize=1000, ringSize=0):
+        self.rowShape = tuple(rowShape) if isinstance(rowShape, (tuple, list)) else (rowShape,)
+        self.dtype = np.dtype(dtype)
+        self.ringSize = ringSize
+        self.blockSize = ringSize if ringSize > 0 else blockSize
+
+        self.blocks = []            # Full blocks (not used in ring mode)
+        self.block = np.empty((self.blockSize,) + self.rowShape, dtype=self.dtype)
+        self.blockIndex = 0         # Next row to write in the current block
+        self.count = 0              # Total number of appended rows
+
+    def __len__(self):
+        """ Function that returns the number of stored rows.
+        """
+        if self.ringSize > 0:
+            return min(self.count, self.ringSize)
+        return self.count
+
+    def nextRow(self):
+        """ Function that returns a writable view of the next row (the row is considered stored).
+        """
+        if self.blockIndex == self.blockSize:
+            if self.ringSize > 0:
+                self.blockIndex = 0
+            else:
+                self.blocks.append(self.block)
+                self.block = np.empty((self.blockSize,) + self.rowShape, dtype=self.dtype)
+                self.blockIndex = 0
+
+        row = self.block[self.blockIndex]
+        self.blockIndex += 1
+        self.count += 1
+        return row
+
+    def append(self, row):
+        """ Function that stores a new row.
+        """
+        if self.rowShape:
+            self.nextRow()[...] = row
+        else:
+            # Scalar rows: indexing returns a copy, so write to the block directly
+            self.nextRow()
+            self.block[self.blockIndex - 1] = row
+
+    def lastBlock(self):
+        """ Function that returns a view of the rows stored in the current block.
+        """
+        return self.block[:self.blockIndex]
+
+    def toArray(self):
+        """ Function that returns all the stored rows as a single array (in acquisition order).
+        """
+        if self.ringSize > 0:
+            if self.count < self.ringSize:
+                return self.block[:self.blockIndex].copy()
+            return np.concatenate((self.block[self.blockIndex:], self.block[:self.blockIndex]))
+
+        return np.concatenate(self.blocks + [self.block[:self.blockIndex]])
+
+    def clear(self):
+        """ Function that removes all the stored rows (the current block is reused).
+        """
+        self.blocks = []
+        self.blockIndex = 0
+        self.count = 0
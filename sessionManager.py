@@ -0,0 +1,151 @@
+""" Acquisition from several Odisi systems simultaneously (in a single process and thread, with asyncio).
+
+Example:
+    session = sessionManager({'north': ('169.254.151.199', 50000), 'south': ('169.254.151.200', 50000)})
+    async for cycles in session.alignedCycles():
+        commonTime, alignedData = alignCycles(cycles)
+"""
+
+import time
+import asyncio
+import numpy as np
+from asyncOdisiClient import asyncOdisiClient
+
+def alignCycles(cycles, period=None, tolerance=0.5):
+    """ Function that aligns the measurement cycles of several devices on a common time axis.
+    Inputs:
+        cycles: dict
+            Device name -> (measurementObj, (measurementData, timeData, positionData, posNames, gapSummary)).
+        period: float
+            Period of the common time axis (microseconds). By default, the largest device period.
+        tolerance: float
+            Maximum distance to the nearest sample, as a fraction of the period. Farther samples are NaN.
+    Outputs:
+        commonTime: np.ndarray (int64)
+            Common time axis (microseconds since the epoch), over the interval measured by all the devices.
+        alignedData: dict
+            Device name -> array with one row per commonTime value (nearest sample of the device).
+    """
+    timeData = {name: np.asarray(cycle[1][1], dtype=np.int64) for name, cycle in cycles.items()}
+    if any(len(deviceTime) == 0 for deviceTime in timeData.values()):
+        return np.zeros(0, dtype=np.int64), {name: cycle[1][0][:0] for name, cycle in cycles.items()}
+
+    if period is None:
+        period = max(float(np.median(np.diff(deviceTime))) if len(deviceTime) > 1 else 0.0 for deviceTime in timeData.values())
+        period = max(period, 1.0)
+    startTime = max(deviceTime[0] for deviceTime in timeData.values())
+    endTime = min(deviceTime[-1] for deviceTime in timeData.values())
+    commonTime = np.arange(startTime, endTime + 1, period).astype(np.int64)
+
+    alignedData = {}
+    for name, cycle in cycles.items():
+        deviceTime = timeData[name]
+        measurementData = np.asarray(cycle[1][0])
+
+        # Nearest sample of the device for every common time value
+        index = np.clip(np.searchsorted(deviceTime, commonTime), 1, len(deviceTime) - 1)
+        previousCloser = (commonTime - deviceTime[index - 1]) <= (deviceTime[index] - commonTime)
+        index = np.where(previousCloser, index - 1, index)
+        if len(deviceTime) == 1:
+            index = np.zeros(len(commonTime), dtype=np.intp)
+
+        deviceAligned = measurementData[index].astype(np.float64)
+        deviceAligned[np.abs(deviceTime[index] - commonTime) > tolerance * period] = np.nan
+        alignedData[name] = deviceAligned
+
+    return commonTime, alignedData
+
+class sessionManager:
+    """ Multi-device session class
+
+    Inputs:
+        devices: dict
+            Device name -> (ip address, port).
+        measurementFactory: function
+            Function that receives the device name and returns a new measurementHandler for every cycle
+            (default: measurementHandler()), e.g. to stream every device to its own files.
+    """
+    def __init__(self, devices, measurementFactory=None, reconnect=True):
+        self.clients = {}
+        for name, (host, port) in devices.items():
+            factory = None
+            if measurementFactory is not None:
+                factory = (lambda name=name: measurementFactory(name))
+            self.clients[name] = asyncOdisiClient(host, port, reconnect=reconnect, measurementFactory=factory)
+
+        self.cycleQueue = None
+        self.tasks = []
+        self.startTime = None
+        self.cyclesAcquired = {name: 0 for name in devices}
+        self.measurementsAcquired = {name: 0 for name in devices}
+        self.lostPackages = {name: 0 for name in devices}
+
+    async def start(self):
+        """ Function that starts the acquisition of all the devices (one task per device).
+        """
+        self.cycleQueue = asyncio.Queue()
+        self.startTime = time.monotonic()
+        self.tasks = [asyncio.ensure_future(self.acquire(name, client)) for name, client in self.clients.items()]
+
+    async def acquire(self, name, client):
+        """ Function that runs the acquisition of one device.
+        """
+        try:
+            async for measurementObj, cycle in client.cycles():
+                self.cyclesAcquired[name] += 1
+                self.measurementsAcquired[name] += measurementObj.getSampleCount()
+                self.lostPackages[name] += measurementObj.lostPackages
+                await self.cycleQueue.put((name, measurementObj, cycle))
+        except Exception as error:
+            await self.cycleQueue.put((name, None, error))
+
+    async def cycles(self):
+        """ Asynchronous generator that yields the cycles of all the devices as (device name, measurementObj, cycle),
+        in the order they are completed.
+        """
+        if self.cycleQueue is None:
+            await self.start()
+        while True:
+            name, measurementObj, cycle = await self.cycleQueue.get()
+            if measurementObj is None:
+                raise cycle
+            yield name, measurementObj, cycle
+
+    async def alignedCycles(self):
+        """ Asynchronous generator that waits for one cycle of every device and yields them together
+        as a dictionary (device name -> (measurementObj, cycle)), ready for alignCycles().
+        """
+        pending = {}
+        async for name, measurementObj, cycle in self.cycles():
+            if name in pending:
+                print('Warning: cycle of device %s replaced before the other devices finished theirs' % name)
+            pending[name] = (measurementObj, cycle)
+            if len(pending) == len(self.clients):
+                yield pending
+                pending = {}
+
+    def getStats(self):
+        """ Function that returns the throughput and loss statistics of every device.
+        """
+        elapsed = max(time.monotonic() - self.startTime, 1e-9) if self.startTime is not None else 0.0
+        stats = {}
+        for name, client in self.clients.items():
+            stats[name] = {'connections': client.connectionCount,
+                           'bytes received': client.bytesReceived,
+                           'packages received': client.packagesReceived,
+                           'cycles acquired': self.cyclesAcquired[name],
+                           'measurements acquired': self.measurementsAcquired[name],
+                           'lost packages': self.lostPackages[name],
+                           'bytes per second': client.bytesReceived / elapsed if elapsed else 0.0,
+                           'packages per second': client.packagesReceived / elapsed if elapsed else 0.0}
+        return stats
+
+    async def close(self):
+        """ Function that stops the acquisition of all the devices.
+        """
+        for client in self.clients.values():
+            await client.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
@@ -0,0 +1,261 @@
+""" Shared-memory ring buffer of the measurement, so other processes can read the data while measuring.
+
+The measurementHandler copies every stored row into the ring (measurementHandler(sharedRing=...)), and the
+readers (sharedRingReader, e.g. in a ProcessPool) get NumPy views of the new rows without further copies.
+The ring only keeps the last ring size rows: the whole cycle is still kept (or streamed) by the measurementHandler.
+The ring is a multiprocessing.shared_memory block (or a memory-mapped file, with path):
+    header (HEADER_FIELDS int64) + positions (float64, gages) + timestamps (int64, ring size)
+    + rows (float64, ring size x gages)
+Header: magic, number of gages, ring size, write count (rows written in the cycle), sequence number of the
+last package, cycle number, state (RING_MEASURING, RING_FINISHED or RING_CLOSED).
+The write count is updated after the row is written, so the rows before it are complete.
+
+Example (analysis process):
+    reader = sharedRingReader('odisi_ring')
+    lastCount = 0
+    while True:
+        rows, timeData, lastCount = reader.newRows(lastCount)
+"""
+
+import mmap
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+RING_MAGIC = 0x4F444953524E4731       # 'ODISRNG1'
+HEADER_FIELDS = 8
+MAGIC, GAGES, RING_SIZE, WRITE_COUNT, SEQUENCE, CYCLE, STATE = range(7)
+RING_MEASURING = 1
+RING_FINISHED = 2
+RING_CLOSED = 3
+
+def ringBytes(gagesNumber, ringSize):
+    """ Function that returns the size of a ring (bytes).
+    """
+    return 8 * (HEADER_FIELDS + gagesNumber + ringSize + ringSize * gagesNumber)
+
+def ringViews(buffer, gagesNumber, ringSize):
+    """ Function that returns the header, positions, timestamps and rows of a ring as NumPy views of the buffer.
+    """
+    header = np.frombuffer(buffer, dtype=np.int64, count=HEADER_FIELDS)
+    offset = 8 * HEADER_FIELDS
+    position = np.frombuffer(buffer, dtype=np.float64, count=gagesNumber, offset=offset)
+    offset += 8 * gagesNumber
+    timeData = np.frombuffer(buffer, dtype=np.int64, count=ringSize, offset=offset)
+    offset += 8 * ringSize
+    data = np.frombuffer(buffer, dtype=np.float64, count=ringSize * gagesNumber, offset=offset).reshape(ringSize, gagesNumber)
+    return header, position, timeData, data
+
+def openSharedMemory(name):
+    """ Function that attaches to an existing shared memory block (without registering it, so it is not
+    removed when the reader finishes). The readers are meant to run in other processes than the writer.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        from multiprocessing import resource_tracker
+        sharedMemory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(sharedMemory._name, 'shared_memory')
+        return sharedMemory
+
+class sharedRingBuffer:
+    """ Shared ring buffer class (writer side)
+
+    Inputs:
+        name: str
+            Name of the shared memory block (the readers attach with the same name).
+        ringSize: int
+            Number of rows kept in the ring.
+        path: str
+            If given, a memory-mapped file is used instead of shared memory.
+    The ring is created with the first cycle, and reused by the next cycles with the same number of gages.
+    """
+    def __init__(self, name='odisi_ring', ringSize=10000, path=None):
+        self.name = name
+        self.ringSize = ringSize
+        self.path = path
+        self.sharedMemory = None
+        self.mappedFile = None
+        self.buffer = None
+        self.gagesNumber = -1
+        self.cycle = 0
+        self.header = self.position = self.time = self.data = None
+
+    def allocate(self, gagesNumber, position):
+        """ Function that prepares the ring for a new cycle (it is created again if the number of gages changed).
+        """
+        if gagesNumber != self.gagesNumber:
+            self.release()
+            size = ringBytes(gagesNumber, self.ringSize)
+            if self.path is not None:
+                with open(self.path, 'w+b') as ringFile:
+                    ringFile.truncate(size)
+                    self.mappedFile = mmap.mmap(ringFile.fileno(), size)
+                self.buffer = self.mappedFile
+            else:
+                try:
+                    self.sharedMemory = shared_memory.SharedMemory(self.name, create=True, size=size)
+                except FileExistsError:
+                    # Left by a previous (interrupted) run. It is attached with tracking (not with openSharedMemory),
+                    # so the unregister done by unlink matches the register of the constructor
+                    staleMemory = shared_memory.SharedMemory(self.name)
+                    staleMemory.close()
+                    staleMemory.unlink()
+                    self.sharedMemory = shared_memory.SharedMemory(self.name, create=True, size=size)
+                self.buffer = self.sharedMemory.buf
+            self.header, self.position, self.time, self.data = ringViews(self.buffer, gagesNumber, self.ringSize)
+            self.gagesNumber = gagesNumber
+            self.header[MAGIC] = RING_MAGIC
+            self.header[GAGES] = gagesNumber
+            self.header[RING_SIZE] = self.ringSize
+
+        self.cycle += 1
+        self.position[:] = position
+        self.header[WRITE_COUNT] = 0
+        self.header[SEQUENCE] = 0
+        self.header[CYCLE] = self.cycle
+        self.header[STATE] = RING_MEASURING
+
+    def writeRow(self, row, timestamp, sequenceNumber):
+        """ Function that copies a row into the ring and publishes it (called by measurementHandler for every row).
+        """
+        count = int(self.header[WRITE_COUNT])
+        index = count % self.ringSize
+        self.data[index] = row
+        self.time[index] = timestamp
+        self.header[SEQUENCE] = sequenceNumber
+        # Updated after the row is written, so the readers only see complete rows
+        self.header[WRITE_COUNT] = count + 1
+
+    def finish(self):
+        """ Function that marks the end of the cycle (the data stays in the ring until the next cycle).
+        """
+        if self.header is not None:
+            self.header[STATE] = RING_FINISHED
+
+    def release(self):
+        """ Function that marks the ring as closed and frees it.
+        """
+        if self.header is None:
+            return
+        self.header[STATE] = RING_CLOSED
+        # The views must be released before closing the buffer
+        self.header = self.position = self.time = self.data = None
+        self.buffer = None
+        try:
+            if self.sharedMemory is not None:
+                self.sharedMemory.unlink()
+                self.sharedMemory.close()
+            if self.mappedFile is not None:
+                self.mappedFile.close()
+        except BufferError:
+            # Views of the ring are still referenced: it is freed with them
+            pass
+        self.sharedMemory = None
+        self.mappedFile = None
+        self.gagesNumber = -1
+
+    def close(self):
+        self.release()
+
+class sharedRingReader:
+    """ Shared ring buffer class (reader side, e.g. in another process)
+
+    Inputs:
+        name: str
+            Name of the shared memory block (or path of the memory-mapped file, with isFile).
+    """
+    def __init__(self, name='odisi_ring', isFile=False, timeout=10.0):
+        self.name = name
+        self.isFile = isFile
+        self.sharedMemory = None
+        self.mappedFile = None
+        self.attach(timeout)
+
+    def attach(self, timeout=10.0):
+        """ Function that attaches to the ring (waiting until it is created, up to timeout seconds).
+        """
+        self.detach()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.isFile:
+                    with open(self.name, 'rb') as ringFile:
+                        self.mappedFile = mmap.mmap(ringFile.fileno(), 0, access=mmap.ACCESS_READ)
+                    buffer = self.mappedFile
+                else:
+                    self.sharedMemory = openSharedMemory(self.name)
+                    buffer = self.sharedMemory.buf
+                header = np.frombuffer(buffer, dtype=np.int64, count=HEADER_FIELDS)
+                if header[MAGIC] == RING_MAGIC and header[STATE] != RING_CLOSED:
+                    break
+                del header, buffer
+                self.detach()
+            except (FileNotFoundError, ValueError):
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError('Shared ring %s not found' % self.name)
+            time.sleep(0.05)
+        self.gagesNumber = int(header[GAGES])
+        self.ringSize = int(header[RING_SIZE])
+        self.header, self.position, self.time, self.data = ringViews(buffer, self.gagesNumber, self.ringSize)
+        for view in (self.position, self.time, self.data):
+            view.flags.writeable = False
+        self.cycle = int(self.header[CYCLE])
+
+    def detach(self):
+        """ Function that detaches from the ring (the views returned by newRows must not be used afterwards).
+        """
+        self.header = self.position = self.time = self.data = None
+        try:
+            if self.sharedMemory is not None:
+                self.sharedMemory.close()
+            if self.mappedFile is not None:
+                self.mappedFile.close()
+        except BufferError:
+            # Views returned by newRows are still referenced: the ring is unmapped when they are released
+            pass
+        self.sharedMemory = None
+        self.mappedFile = None
+
+    def getState(self):
+        """ Function that returns (write count, sequence number, cycle number, state) of the ring.
+        """
+        return int(self.header[WRITE_COUNT]), int(self.header[SEQUENCE]), int(self.header[CYCLE]), int(self.header[STATE])
+
+    def newRows(self, lastCount):
+        """ Function that returns the rows written after lastCount.
+        Outputs:
+            rows: np.ndarray
+                New rows (a read-only view of the ring if they are contiguous in it, a copy otherwise).
+            timeData: np.ndarray
+                Timestamps of the new rows (microseconds since the epoch).
+            count: int
+                Write count to use as lastCount in the next call. It restarts from 0 with every new cycle
+                (and the ring is attached again if it was recreated).
+        Rows that were overwritten before being read are skipped (count - lastCount > ring size).
+        The views are only valid until the writer wraps around the ring (ring size rows later): the rows that
+        must be kept longer have to be copied.
+        """
+        if self.header[STATE] == RING_CLOSED:
+            self.attach()
+            lastCount = 0
+        if int(self.header[CYCLE]) != self.cycle:
+            self.cycle = int(self.header[CYCLE])
+            lastCount = 0
+        count = int(self.header[WRITE_COUNT])
+        lastCount = max(lastCount, count - self.ringSize)
+        start, stop = lastCount % self.ringSize, count % self.ringSize
+        if count == lastCount:
+            return self.data[:0], self.time[:0], count
+        if start < stop or stop == 0:
+            stop = stop or self.ringSize
+            rows, timeData = self.data[start:stop], self.time[start:stop]
+        else:
+            rows = np.concatenate((self.data[start:], self.data[:stop]))
+            timeData = np.concatenate((self.time[start:], self.time[:stop]))
+        return rows, timeData, count
+
+    def close(self):
+        self.detach()
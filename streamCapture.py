@@ -0,0 +1,74 @@
+""" Raw capture of the Odisi datastream (record and replay).
+
+A capture file starts with CAPTURE_MAGIC and contains one record per received TCP message:
+    timestamp (int64, nanoseconds since the start of the capture) + size (uint32) + received bytes
+so the exact bytes (and their timing) can be replayed later (see odisiSimulator.serveCapture).
+"""
+
+import time
+import struct
+
+CAPTURE_MAGIC = b'ODISICAP\x01'
+RECORD_HEADER = struct.Struct('<qI')
+
+class captureSocket:
+    """ Capture socket class
+
+    Wraps a connected socket: everything received through it (recv or recv_into) is also written
+    to the capture file. It can be used in place of the socket (getMeasurementCycle, acquisitionPipeline).
+    """
+    def __init__(self, connectedSocket, filename):
+        self.connectedSocket = connectedSocket
+        self.captureFile = open(filename, 'wb')
+        self.captureFile.write(CAPTURE_MAGIC)
+        self.startTime = time.perf_counter_ns()
+        self.bytesCaptured = 0
+
+    def record(self, data):
+        """ Function that appends a received message to the capture file.
+        """
+        self.captureFile.write(RECORD_HEADER.pack(time.perf_counter_ns() - self.startTime, len(data)))
+        self.captureFile.write(data)
+        self.bytesCaptured += len(data)
+
+    def recv(self, bufferSize):
+        data = self.connectedSocket.recv(bufferSize)
+        if data:
+            self.record(data)
+        return data
+
+    def recv_into(self, buffer, nBytes=0):
+        nBytes = self.connectedSocket.recv_into(buffer, nBytes)
+        if nBytes:
+            self.record(memoryview(buffer)[:nBytes])
+        return nBytes
+
+    def shutdown(self, how):
+        self.connectedSocket.shutdown(how)
+
+    def close(self):
+        self.captureFile.close()
+        self.connectedSocket.close()
+
+def readCapture(filename):
+    """ Generator that yields the records of a capture file as (timestamp in seconds, received bytes).
+    """
+    with open(filename, 'rb') as captureFile:
+        if captureFile.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise Exception('%s is not an Odisi capture file!' % filename)
+        while True:
+            header = captureFile.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, size = RECORD_HEADER.unpack(header)
+            data = captureFile.read(size)
+            if len(data) < size:
+                # Truncated record (e.g. the program was killed while capturing)
+                return
+            yield timestamp * 1e-9, data
+
+def isCapture(filename):
+    """ Function that checks if a file is a capture file (or a raw recording).
+    """
+    with open(filename, 'rb') as captureFile:
+        return captureFile.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
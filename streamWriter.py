@@ -0,0 +1,226 @@
+""" Writers to stream the measurement data to disk while the acquisition is running.
+
+streamWriter (default) writes two appendable .npy files (float32 data and int64 timestamps)
+plus a JSON sidecar with the positions, gage names and metadata. The sidecar is written with the first
+block (so an interrupted stream can still be interpreted) and rewritten with the final counts and the
+gap summary when the writer is closed ('complete' is True then). The .npy headers are rewritten
+with the final number of rows when the writer is closed, so the files can be opened directly
+with np.load (also with mmap_mode='r' for very large files).
+hdf5StreamWriter writes the same information to a single HDF5 file (only if h5py is installed).
+"""
+
+import os
+import json
+import struct
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+NPY_HEADER_SIZE = 256   # Fixed size of the .npy header, so it can be rewritten in place
+
+def writeNpyHeader(fileObj, dtype, shape):
+    """ Function that writes a fixed-size .npy (version 1.0) header at the current position of fileObj.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.dtype(dtype).str, tuple(shape))
+    headerLength = NPY_HEADER_SIZE - 10
+    if len(header) + 1 > headerLength:
+        raise Exception('Array shape too large for the .npy header!')
+    fileObj.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', headerLength))
+    fileObj.write((header.ljust(headerLength - 1) + '\n').encode('latin1'))
+
+def openStreamWriter(basename, fileFormat='npy'):
+    """ Function that creates the stream writer for the requested format ('npy' or 'hdf5').
+    """
+    if fileFormat == 'npy':
+        return streamWriter(basename)
+    elif fileFormat == 'hdf5':
+        return hdf5StreamWriter(basename)
+    raise ValueError('Unknown stream format: %s' % fileFormat)
+
+def loadStream(basename):
+    """ Function that loads a stream saved by streamWriter.
+
+    The number of rows is obtained from the file sizes, so a stream that was not closed
+    (e.g. the program was killed while measuring) can also be recovered.
+    Outputs:
+        data: np.memmap
+            Measurement data (float32), memory-mapped.
+        time: np.ndarray
+            Timestamps (microseconds since the epoch).
+        info: dict
+            Contents of the JSON sidecar (positions, names, metadata), empty if there is no sidecar.
+    """
+    info = {}
+    if os.path.exists(basename + '.json'):
+        with open(basename + '.json') as jsonFile:
+            info = json.load(jsonFile)
+
+    with open(basename + '.data.npy', 'rb') as dataFile:
+        np.lib.format.read_magic(dataFile)
+        gagesNumber = np.lib.format.read_array_header_1_0(dataFile)[0][1]
+    rowCount = (os.path.getsize(basename + '.data.npy') - NPY_HEADER_SIZE) // (4 * max(1, gagesNumber))
+    rowCount = min(rowCount, (os.path.getsize(basename + '.time.npy') - NPY_HEADER_SIZE) // 8)
+
+    data = np.memmap(basename + '.data.npy', dtype='<f4', mode='r', offset=NPY_HEADER_SIZE, shape=(rowCount, gagesNumber))
+    time = np.fromfile(basename + '.time.npy', dtype='<i8', count=rowCount, offset=NPY_HEADER_SIZE)
+    return data, time, info
+
+class streamWriter:
+    """ Stream writer class (appendable .npy files and JSON sidecar)
+    """
+    def __init__(self, basename):
+        self.basename = basename
+        self.rowCount = 0
+        self.gagesNumber = 0
+        self.dataFile = None
+        self.timeFile = None
+        self.closed = False
+
+    def getFilenames(self, basename=None):
+        """ Function that returns the names of all the files of the stream.
+        """
+        if basename is None:
+            basename = self.basename
+        return [basename + '.data.npy', basename + '.time.npy', basename + '.json']
+
+    def open(self, gagesNumber, info=None):
+        """ Function that creates the files and writes the sidecar (called with the first block).
+        Inputs:
+            info: dict
+                Positions, gage names, metadata, etc. (see measurementHandler.getInfo).
+        """
+        self.gagesNumber = gagesNumber
+        dataFilename, timeFilename, _ = self.getFilenames()
+        self.dataFile = open(dataFilename, 'wb')
+        self.timeFile = open(timeFilename, 'wb')
+        writeNpyHeader(self.dataFile, '<f4', (0, gagesNumber))
+        writeNpyHeader(self.timeFile, '<i8', (0,))
+        self.writeSidecar(info or {}, False)
+
+    def writeSidecar(self, info, complete):
+        """ Function that writes the JSON sidecar (complete is False while the stream is being written).
+        """
+        sidecar = dict(info)
+        sidecar.update({'rows': self.rowCount, 'gages': self.gagesNumber, 'data dtype': 'float32',
+                        'time unit': 'microseconds since the epoch', 'complete': complete})
+        writeInfo(self.getFilenames()[2], sidecar)
+
+    def writeBlock(self, rows, times, info=None):
+        """ Function that appends a block of rows (and their timestamps) to the files.
+        The info (see open) is only used with the first block.
+        """
+        if len(rows) == 0:
+            return
+        if self.dataFile is None:
+            self.open(rows.shape[1], info)
+        self.dataFile.write(np.ascontiguousarray(rows, dtype='<f4').data)
+        self.timeFile.write(np.ascontiguousarray(times, dtype='<i8').data)
+        self.rowCount += len(rows)
+
+    def close(self, info):
+        """ Function that finishes the files: rewrites the .npy headers and writes the JSON sidecar.
+        Inputs:
+            info: dict
+                Positions, gage names, metadata, etc. to save in the sidecar.
+        """
+        if self.closed:
+            return
+        if self.dataFile is None:
+            self.open(len(info.get('positions', [])), info)
+
+        for fileObj, dtype, shape in ((self.dataFile, '<f4', (self.rowCount, self.gagesNumber)),
+                                      (self.timeFile, '<i8', (self.rowCount,))):
+            fileObj.seek(0)
+            writeNpyHeader(fileObj, dtype, shape)
+            fileObj.close()
+
+        self.writeSidecar(info, True)
+        self.closed = True
+
+    def rename(self, basename):
+        """ Function that renames all the files of the (closed) stream. It does not copy any data.
+        """
+        for oldName, newName in zip(self.getFilenames(), self.getFilenames(basename)):
+            os.replace(oldName, newName)
+        self.basename = basename
+        return self.getFilenames()
+
+    def delete(self):
+        """ Function that removes all the files of the (closed) stream.
+        """
+        for filename in self.getFilenames():
+            if os.path.exists(filename):
+                os.remove(filename)
+
+class hdf5StreamWriter(streamWriter):
+    """ Stream writer class (single HDF5 file with chunked, resizable datasets)
+    """
+    def __init__(self, basename):
+        if h5py is None:
+            raise ImportError('h5py is required to stream to HDF5 files')
+        super().__init__(basename)
+        self.h5File = None
+
+    def getFilenames(self, basename=None):
+        if basename is None:
+            basename = self.basename
+        return [basename + '.h5']
+
+    def open(self, gagesNumber, info=None):
+        self.gagesNumber = gagesNumber
+        self.h5File = h5py.File(self.getFilenames()[0], 'w')
+        self.h5File.create_dataset('data', shape=(0, gagesNumber), maxshape=(None, gagesNumber), dtype='f4',
+                                   chunks=(max(1, min(1000, 2**20 // max(1, gagesNumber))), gagesNumber))
+        self.h5File.create_dataset('time', shape=(0,), maxshape=(None,), dtype='i8', chunks=(4096,))
+        self.h5File['time'].attrs['unit'] = 'microseconds since the epoch'
+        self.writeSidecar(info or {}, False)
+
+    def writeSidecar(self, info, complete):
+        """ Function that writes the information as attributes of the HDF5 file.
+        """
+        for key, value in info.items():
+            self.h5File.attrs[key] = json.dumps(value, default=_toJSON)
+        self.h5File.attrs['complete'] = complete
+        self.h5File.flush()
+
+    def writeBlock(self, rows, times, info=None):
+        if len(rows) == 0:
+            return
+        if self.h5File is None:
+            self.open(rows.shape[1], info)
+        newCount = self.rowCount + len(rows)
+        self.h5File['data'].resize(newCount, axis=0)
+        self.h5File['data'][self.rowCount:newCount] = rows
+        self.h5File['time'].resize(newCount, axis=0)
+        self.h5File['time'][self.rowCount:newCount] = times
+        self.rowCount = newCount
+
+    def close(self, info):
+        if self.closed:
+            return
+        if self.h5File is None:
+            self.open(len(info.get('positions', [])), info)
+        self.writeSidecar(info, True)
+        self.h5File.close()
+        self.closed = True
+
+def writeInfo(filename, info):
+    """ Function that writes the information of a measurement to a JSON file (also used for the CSV files).
+    It is written to a temporary file first, so the file is never left half-written.
+    """
+    temporaryFilename = filename + '.tmp'
+    with open(temporaryFilename, 'w') as jsonFile:
+        json.dump(info, jsonFile, indent=1, default=_toJSON)
+    os.replace(temporaryFilename, filename)
+
+def _toJSON(value):
+    """ Function to serialize NumPy values in the JSON sidecar.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type %s is not JSON serializable' % type(value).__name__)
@@ -0,0 +1,144 @@
+import threading
+import numpy as np
+
+class streamingStats:
+    """ Streaming statistics class
+
+    Per-gage statistics updated with every stored row (vectorized over all the gages): running mean and
+    variance (Welford), minimum, maximum, last value and rate of change (units per second).
+    NaN values (e.g. the rows inserted for lost packages) are ignored.
+    Alarms (see addAlarm) call a function when a gage goes out of its limits. The functions are called from
+    the acquisition thread (without holding the lock, so they can call snapshot), so they must return quickly.
+    The statistics can be read from another thread with snapshot(), while the acquisition continues.
+
+    It is used as a measurementHandler listener: measurementHandler(listeners=[streamingStats()]).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.alarms = []
+        self.position = np.zeros(0)
+        self.posNames = ()
+        self.gagesNumber = 0
+        self.rows = 0
+        self.allocate(0)
+
+    def allocate(self, gagesNumber):
+        """ Function that allocates (and resets) the statistics of gagesNumber gages.
+        """
+        self.gagesNumber = gagesNumber
+        self.rows = 0
+        self.count = np.zeros(gagesNumber, dtype=np.int64)
+        self.mean = np.zeros(gagesNumber)
+        self.m2 = np.zeros(gagesNumber)         # Sum of squared differences from the mean (Welford)
+        self.min = np.full(gagesNumber, np.nan)
+        self.max = np.full(gagesNumber, np.nan)
+        self.last = np.full(gagesNumber, np.nan)
+        self.rate = np.full(gagesNumber, np.nan)
+        self.lastTimestamp = None
+        self.timestamp = None
+        # Work arrays (so no memory is allocated for every row)
+        self.valid = np.zeros(gagesNumber, dtype=bool)
+        self.delta = np.zeros(gagesNumber)
+        for alarm in self.alarms:
+            alarm['active'] = np.zeros(len(np.arange(gagesNumber)[alarm['gages']]), dtype=bool)
+
+    def addAlarm(self, callback, low=None, high=None, maxRate=None, gages=slice(None), name='alarm'):
+        """ Function that adds an alarm.
+        Inputs:
+            callback: function
+                Called as callback(name, timestamp, gageIndex, values) when some gages go out of the limits
+                (only once, until they go back inside the limits). gageIndex is the index of those gages in the
+                stored rows (see measurementHandler.position) and values their values.
+            low, high: float
+                Limits of the value (None for no limit).
+            maxRate: float
+                Limit of the absolute rate of change (units per second, None for no limit).
+            gages: slice or np.ndarray
+                Gages checked by the alarm (index in the stored rows, by default all of them).
+        """
+        alarm = {'name': name, 'callback': callback, 'low': low, 'high': high, 'maxRate': maxRate, 'gages': gages,
+                 'active': np.zeros(len(np.arange(self.gagesNumber)[gages]), dtype=bool)}
+        self.alarms.append(alarm)
+        return alarm
+
+    def start(self, position, posNames):
+        """ Function that resets the statistics for a new measurement cycle (called by measurementHandler).
+        """
+        with self.lock:
+            self.position = np.asarray(position)
+            self.posNames = posNames
+            self.allocate(len(self.position))
+
+    def processRow(self, row, timestamp):
+        """ Function that updates the statistics with a new row (timestamp in microseconds since the epoch).
+        """
+        firedAlarms = []
+        with self.lock:
+            if len(row) != self.gagesNumber:
+                self.allocate(len(row))
+            valid, delta = self.valid, self.delta
+            np.isfinite(row, out=valid)
+            self.rows += 1
+            self.count += valid
+
+            # Welford update (delta is 0 for the invalid values, so they do not change the statistics)
+            np.subtract(row, self.mean, out=delta, where=valid)
+            delta[~valid] = 0.0
+            self.mean += delta / np.maximum(self.count, 1)
+            self.m2 += delta * np.where(valid, row - self.mean, 0.0)
+            np.fmin(self.min, row, out=self.min)
+            np.fmax(self.max, row, out=self.max)
+
+            if self.lastTimestamp is not None and timestamp > self.lastTimestamp:
+                self.rate = (row - self.last) / ((timestamp - self.lastTimestamp) * 1e-6)
+            np.copyto(self.last, row)
+            self.lastTimestamp = timestamp
+            self.timestamp = timestamp
+
+            if self.alarms:
+                firedAlarms = self.checkAlarms(row)
+
+        # The callbacks are called after releasing the lock
+        for callback, name, gageIndex, values in firedAlarms:
+            callback(name, timestamp, gageIndex, values)
+
+    def checkAlarms(self, row):
+        """ Function that returns the alarms of the gages that went out of their limits, as
+        (callback, name, gage index, values).
+        """
+        firedAlarms = []
+        for alarm in self.alarms:
+            values = row[alarm['gages']]
+            outside = np.zeros(len(values), dtype=bool)
+            if alarm['low'] is not None:
+                outside |= values < alarm['low']
+            if alarm['high'] is not None:
+                outside |= values > alarm['high']
+            if alarm['maxRate'] is not None:
+                outside |= np.abs(self.rate[alarm['gages']]) > alarm['maxRate']
+            newAlarms = outside & ~alarm['active']
+            alarm['active'] = outside
+            if newAlarms.any():
+                gageIndex = np.arange(self.gagesNumber)[alarm['gages']][newAlarms]
+                firedAlarms.append((alarm['callback'], alarm['name'], gageIndex, values[newAlarms]))
+        return firedAlarms
+
+    def finish(self):
+        """ Function called by measurementHandler at the end of the cycle (the statistics are kept).
+        """
+        pass
+
+    def snapshot(self):
+        """ Function that returns a copy of the current statistics (it can be called from any thread).
+        Outputs:
+            stats: dict
+                'rows', 'timestamp' (microseconds since the epoch), 'position', 'names' and, per gage,
+                'count', 'mean', 'std', 'min', 'max', 'last' and 'rate' (units per second).
+        """
+        with self.lock:
+            variance = np.full(self.gagesNumber, np.nan)
+            np.divide(self.m2, self.count - 1, out=variance, where=self.count > 1)
+            return {'rows': self.rows, 'timestamp': self.timestamp, 'position': self.position, 'names': self.posNames,
+                    'count': self.count.copy(), 'mean': np.where(self.count > 0, self.mean, np.nan),
+                    'std': np.sqrt(variance), 'min': self.min.copy(), 'max': self.max.copy(),
+                    'last': self.last.copy(), 'rate': self.rate.copy()}